@@ -61,6 +61,18 @@ JOIN transactions t ON cs.customer_id = t.customer_id
 GROUP BY cs.segment_name
 ORDER BY avg_purchase_amount DESC;
 
+-- RFM Score Distribution
+SELECT 
+    rfm_segment,
+    COUNT(*) as customer_count,
+    AVG(FLOOR(rfm_score / 100)) as avg_recency_score,
+    AVG(FLOOR(rfm_score / 10) % 10) as avg_frequency_score,
+    AVG(rfm_score % 10) as avg_monetary_score
+FROM customer_segments
+WHERE rfm_score IS NOT NULL
+GROUP BY rfm_segment
+ORDER BY customer_count DESC;
+
 -- Top Product Recommendations
 SELECT 
     t1.product_category as product,
@@ -81,4 +93,16 @@ SELECT
     accuracy_score,
     created_at
 FROM predictive_models
-ORDER BY accuracy_score DESC; 
\ No newline at end of file
+ORDER BY accuracy_score DESC;
+
+-- Pipeline Stage Performance
+SELECT 
+    stage_name,
+    COUNT(*) as runs,
+    AVG(wall_seconds) as avg_wall_seconds,
+    MAX(wall_seconds) as max_wall_seconds,
+    AVG(cpu_seconds) as avg_cpu_seconds,
+    MAX(CASE WHEN NOT peak_rss_inherited THEN peak_rss_mb END) as max_peak_rss_mb
+FROM pipeline_metrics
+GROUP BY stage_name
+ORDER BY avg_wall_seconds DESC;
\ No newline at end of file
@@ -15,6 +15,7 @@ CREATE TABLE IF NOT EXISTS transactions (
     country VARCHAR(100),
     payment_method VARCHAR(50),
     customer_age INT,
+    row_hash BIGINT UNSIGNED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -23,6 +24,7 @@ CREATE TABLE IF NOT EXISTS customer_segments (
     customer_id VARCHAR(50) PRIMARY KEY,
     segment_name VARCHAR(50),
     rfm_score INT,
+    rfm_segment VARCHAR(50),
     cluster_id INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (customer_id) REFERENCES transactions(customer_id)
@@ -44,11 +46,55 @@ CREATE TABLE IF NOT EXISTS predictive_models (
     model_name VARCHAR(100),
     model_type VARCHAR(50),
     accuracy_score DECIMAL(5,2),
+    artifact_path VARCHAR(255),
+    data_fingerprint CHAR(64),
+    feature_schema TEXT,
+    metrics TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create pipeline metrics table
+CREATE TABLE IF NOT EXISTS pipeline_metrics (
+    metric_id INT AUTO_INCREMENT PRIMARY KEY,
+    run_id VARCHAR(50),
+    stage_name VARCHAR(100),
+    wall_seconds DECIMAL(12,4),
+    cpu_seconds DECIMAL(12,4),
+    rows_in BIGINT,
+    rows_out BIGINT,
+    peak_rss_mb DECIMAL(12,2),
+    peak_rss_inherited BOOLEAN,
+    status VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create ingest tracking table (source files and byte offsets already loaded)
+CREATE TABLE IF NOT EXISTS ingest_files (
+    source_path VARCHAR(255) PRIMARY KEY,
+    byte_offset BIGINT,
+    fingerprint CHAR(64),
+    rows_read BIGINT,
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create transaction change log for incremental downstream processing
+CREATE TABLE IF NOT EXISTS transaction_changes (
+    change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    batch_id VARCHAR(50),
+    transaction_id VARCHAR(50),
+    change_type VARCHAR(10),
+    customer_id VARCHAR(50),
+    transaction_date DATETIME,
+    old_customer_id VARCHAR(50),
+    old_transaction_date DATETIME,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better query performance
 CREATE INDEX idx_transaction_date ON transactions(transaction_date);
 CREATE INDEX idx_customer_id ON transactions(customer_id);
 CREATE INDEX idx_product_category ON transactions(product_category);
-CREATE INDEX idx_country ON transactions(country); 
\ No newline at end of file
+CREATE INDEX idx_country ON transactions(country);
+CREATE INDEX idx_stage_name ON pipeline_metrics(stage_name);
+CREATE INDEX idx_model_fingerprint ON predictive_models(model_name, data_fingerprint);
+CREATE INDEX idx_batch_id ON transaction_changes(batch_id); 
\ No newline at end of file
@@ -0,0 +1,357 @@
+import pandas as pd
+import numpy as np
+import argparse
+import os
+from dotenv import load_dotenv
+
+from duckdb_engine import ANALYTICS_ENGINE, create_duckdb_connection, read_sql, run_report_queries
+from instrumentation import instrument
+from sketches import HLL_PRECISION, SAMPLE_RATE, HyperLogLog, QuantileSketch, hash_keys, hll_positions, sample_mask
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters
+APPROXIMATE_REPORTS = os.getenv('APPROXIMATE_REPORTS', '0').lower() in ('1', 'true', 'yes')
+SKETCH_DIR = os.getenv('SKETCH_DIR', os.path.join('data', '.sketches'))
+GROUP_HLL_PRECISION = 12  # Per-age-group distinct counts: 4 KB per group and day, ~1.6% standard error
+
+# Same buckets as the Customer Age Distribution report in sql/queries.sql
+AGE_GROUPS = ['18-24', '25-34', '35-44', '45-54', '55+']
+# Low-cardinality columns, counted exactly per day
+DIMENSIONS = ['country', 'product_category', 'payment_method']
+
+# The store keeps every day in one file per part, sorted by day: HyperLogLog
+# registers as memory-mapped .npy arrays, everything else as Parquet tables
+STORE_ARRAYS = ['days', 'customers', 'age_customers']
+STORE_TABLES = ['daily', 'counts', 'amounts', 'purchases']
+
+SKETCH_QUERY = """
+SELECT
+    customer_id,
+    transaction_date,
+    total_amount,
+    product_category,
+    country,
+    payment_method,
+    customer_age
+FROM transactions
+{where}
+"""
+
+def age_groups(ages):
+    """Bucket ages the way the SQL age report does (NULL ages fall into 55+)."""
+    ages = pd.Series(ages, dtype=float).to_numpy()
+    return np.select([ages < 25, ages <= 34, ages <= 44, ages <= 54], AGE_GROUPS[:4], default=AGE_GROUPS[4])
+
+def build_day_tables(df):
+    """Summarize transactions (SKETCH_QUERY columns) into per-day store parts.
+
+    Returns a dict with the days covered, per-day HyperLogLog registers for
+    all customers and per age group, and tables of exact per-day totals,
+    dimension counts and sums, amount bucket counts and purchases of
+    hash-sampled customers.
+    """
+    days = pd.to_datetime(df['transaction_date']).dt.normalize().to_numpy(dtype='datetime64[D]')
+    day_index, unique_days = pd.factorize(days, sort=True)
+    day_index = day_index.astype(np.int64)
+    amounts = df['total_amount'].to_numpy(dtype=float)
+    groups = age_groups(df['customer_age'])
+    hashes = hash_keys(df['customer_id'])
+
+    customers = np.zeros((len(unique_days), 1 << HLL_PRECISION), dtype=np.uint8)
+    index, rank = hll_positions(hashes, HLL_PRECISION)
+    np.maximum.at(customers, (day_index, index), rank)
+
+    age_customers = np.zeros((len(unique_days), len(AGE_GROUPS), 1 << GROUP_HLL_PRECISION), dtype=np.uint8)
+    group_index = pd.Categorical(groups, categories=AGE_GROUPS).codes.astype(np.int64)
+    index, rank = hll_positions(hashes, GROUP_HLL_PRECISION)
+    np.maximum.at(age_customers, (day_index, group_index, index), rank)
+
+    frame = pd.DataFrame({'day': pd.to_datetime(days), 'amount': amounts, 'age_group': groups})
+    for dimension in DIMENSIONS:
+        frame[dimension] = df[dimension].to_numpy()
+
+    daily = frame.assign(zero=~(frame['amount'] > 0) & frame['amount'].notna()).groupby('day').agg(
+        transactions=('amount', 'size'), total_amount=('amount', 'sum'), zero_amounts=('zero', 'sum')
+    ).reset_index()
+
+    counts = pd.concat([
+        frame.groupby(['day', dimension])['amount'].agg(['count', 'sum'])
+             .rename_axis(['day', 'key']).reset_index().assign(dimension=dimension)
+        for dimension in DIMENSIONS + ['age_group']
+    ], ignore_index=True)[['day', 'dimension', 'key', 'count', 'sum']]
+
+    positive = frame['amount'] > 0
+    buckets = pd.DataFrame({
+        'day': frame.loc[positive, 'day'],
+        'bucket': QuantileSketch().bucket_keys(frame.loc[positive, 'amount'].to_numpy()),
+    })
+    bucket_counts = buckets.groupby(['day', 'bucket']).size().rename('count').reset_index()
+
+    sampled = sample_mask(hashes)
+    purchases = pd.DataFrame({
+        'day': frame.loc[sampled, 'day'],
+        'customer_id': df['customer_id'].astype(str).to_numpy()[sampled],
+    }).groupby(['day', 'customer_id']).size().rename('purchases').reset_index()
+
+    return {
+        'days': np.asarray(unique_days, dtype='datetime64[D]'),
+        'customers': customers,
+        'age_customers': age_customers,
+        'daily': daily,
+        'counts': counts,
+        'amounts': bucket_counts,
+        'purchases': purchases,
+    }
+
+def _store_path(part):
+    extension = 'npy' if part in STORE_ARRAYS else 'parquet'
+    return os.path.join(SKETCH_DIR, f"{part}.{extension}")
+
+def save_store(store):
+    """Write every part of the store, each replaced atomically."""
+    if not os.path.exists(SKETCH_DIR):
+        os.makedirs(SKETCH_DIR)
+    for part in STORE_ARRAYS + STORE_TABLES:
+        path = _store_path(part)
+        with open(path + '.tmp', 'wb') as f:
+            if part in STORE_ARRAYS:
+                np.save(f, np.ascontiguousarray(store[part]))
+            else:
+                store[part].to_parquet(f, index=False)
+        os.replace(path + '.tmp', path)
+
+def load_store(start=None, end=None):
+    """Read the days between start and end (inclusive) from the store, or None if it is missing.
+
+    Register arrays are memory-mapped, so only the selected days are read.
+    """
+    if not os.path.exists(_store_path('days')):
+        return None
+    days = np.load(_store_path('days'))
+    lo = 0 if start is None else np.searchsorted(days, np.datetime64(pd.Timestamp(start).date()), side='left')
+    hi = len(days) if end is None else np.searchsorted(days, np.datetime64(pd.Timestamp(end).date()), side='right')
+
+    store = {'days': days[lo:hi]}
+    for part in ['customers', 'age_customers']:
+        store[part] = np.load(_store_path(part), mmap_mode='r')[lo:hi]
+    for part in STORE_TABLES:
+        table = pd.read_parquet(_store_path(part))
+        if start is not None or end is not None:
+            day = table['day'].to_numpy(dtype='datetime64[D]')
+            table = table[(day >= days[lo]) & (day <= days[hi - 1])] if hi > lo else table.iloc[:0]
+        store[part] = table.reset_index(drop=True)
+    return store
+
+def _replace_days(store, new, days):
+    """Drop `days` from store and add the days in new, keeping parts sorted by day."""
+    days = np.union1d(np.asarray(days, dtype='datetime64[D]'), new['days'])
+    keep = ~np.isin(store['days'], days)
+    all_days = np.concatenate([store['days'][keep], new['days']])
+    order = np.argsort(all_days, kind='stable')
+
+    merged = {'days': all_days[order]}
+    for part in ['customers', 'age_customers']:
+        merged[part] = np.concatenate([store[part][keep], new[part]])[order]
+    for part in STORE_TABLES:
+        table = store[part]
+        kept = table[~np.isin(table['day'].to_numpy(dtype='datetime64[D]'), days)]
+        merged[part] = pd.concat([kept, new[part]], ignore_index=True).sort_values('day', kind='stable')
+    return merged
+
+@instrument()
+def build_daily_sketches(df, replace_all=False):
+    """Summarize df into the sketch store and return the number of days it covers.
+
+    Days present in df replace the stored ones. With replace_all, days not
+    in df are removed too (use after a full reload).
+    """
+    new = build_day_tables(df)
+    existing = None if replace_all else load_store()
+    save_store(new if existing is None else _replace_days(existing, new, new['days']))
+    return len(new['days'])
+
+@instrument()
+def refresh_daily_sketches(connection, days):
+    """Rebuild the store entries of just the given days from the transactions table.
+
+    Pass incremental_ingest.affected_days(changes) after an incremental load.
+    """
+    frames = []
+    for day in days:
+        start = pd.Timestamp(day).normalize()
+        where = "WHERE transaction_date >= %s AND transaction_date < %s"
+        frames.append(read_sql(SKETCH_QUERY.format(where=where), connection,
+                               params=(start.to_pydatetime(), (start + pd.Timedelta(days=1)).to_pydatetime())))
+    if not frames:
+        return
+    new = build_day_tables(pd.concat(frames, ignore_index=True))
+    existing = load_store()
+    save_store(new if existing is None else _replace_days(existing, new, [pd.Timestamp(d) for d in days]))
+
+class SketchSummary:
+    """Store parts merged over a range of days, ready for the reports."""
+
+    def __init__(self, store):
+        daily = store['daily']
+        self.days = len(store['days'])
+        self.transactions = int(daily['transactions'].sum())
+        self.total_amount = float(daily['total_amount'].sum())
+        self.daily_sales = daily.groupby('day')['total_amount'].sum()
+
+        # Merging HyperLogLogs is an element-wise max over the days' registers
+        self.customers = HyperLogLog(HLL_PRECISION, np.max(store['customers'], axis=0))
+        age_registers = np.max(store['age_customers'], axis=0)
+        self.age_customers = {group: HyperLogLog(GROUP_HLL_PRECISION, age_registers[i])
+                              for i, group in enumerate(AGE_GROUPS)}
+
+        counts = store['counts'].groupby(['dimension', 'key'])[['count', 'sum']].sum()
+        self.counts = {
+            dimension: (counts.loc[dimension].sort_values('count', ascending=False)
+                        if dimension in counts.index.get_level_values(0) else counts.iloc[:0])
+            for dimension in DIMENSIONS + ['age_group']
+        }
+
+        buckets = store['amounts'].groupby('bucket')['count'].sum()
+        self.amounts = QuantileSketch.from_counts(buckets.index, buckets.to_numpy(), daily['zero_amounts'].sum())
+        self.purchase_counts = store['purchases'].groupby('customer_id')['purchases'].sum()
+        self.sample_rate = SAMPLE_RATE
+
+@instrument()
+def load_sketches(start=None, end=None):
+    """Merge the stored days between start and end (inclusive) on demand.
+
+    Returns None when no sketches have been built or none fall in the range.
+    """
+    store = load_store(start, end)
+    if store is None or len(store['days']) == 0:
+        return None
+    return SketchSummary(store)
+
+def behavior_aggregates(df=None, sketch=None):
+    """Inputs for the customer behavior charts, exact from df or approximate from a sketch.
+
+    Returns a dict of amounts and purchase frequencies (values with
+    per-value weights), category, payment and country counts (Series), and
+    daily sales (DataFrame).
+    """
+    if sketch is None:
+        customer_frequency = df.groupby('customer_id').size()
+        daily_sales = df.groupby(pd.to_datetime(df['transaction_date']))['total_amount'].sum().reset_index()
+        return {
+            'amounts': (df['total_amount'], None),
+            'payment_counts': df['payment_method'].value_counts(),
+            'category_counts': df['product_category'].value_counts(),
+            'purchase_frequency': (customer_frequency, None),
+            'country_counts': df['country'].value_counts(),
+            'daily_sales': daily_sales,
+        }
+
+    # Only the amount histogram and purchase frequency are approximate
+    frequency = sketch.purchase_counts
+    return {
+        'amounts': (sketch.amounts.bucket_values(), sketch.amounts.counts),
+        'payment_counts': sketch.counts['payment_method']['count'],
+        'category_counts': sketch.counts['product_category']['count'],
+        'purchase_frequency': (frequency.to_numpy(), np.full(len(frequency), 1 / sketch.sample_rate)),
+        'country_counts': sketch.counts['country']['count'],
+        'daily_sales': sketch.daily_sales.rename_axis('transaction_date').reset_index(),
+    }
+
+def country_sales_report(sketch=None, connection=None):
+    """Sales by country from the store's exact per-day counts, or via SQL."""
+    if sketch is None:
+        return run_report_queries(connection, titles=['Sales Analysis by Country'])['Sales Analysis by Country']
+
+    countries = sketch.counts['country']
+    report = pd.DataFrame({
+        'country': countries.index,
+        'total_transactions': countries['count'].astype(int).to_numpy(),
+        'total_sales': countries['sum'].to_numpy(),
+    })
+    report['avg_transaction_value'] = report['total_sales'] / report['total_transactions']
+    return report.sort_values('total_sales', ascending=False).reset_index(drop=True)
+
+def age_group_report(sketch=None, connection=None):
+    """Customers and average purchase by age group, approximate or exact via SQL."""
+    if sketch is None:
+        return run_report_queries(connection, titles=['Customer Age Distribution'])['Customer Age Distribution']
+
+    counts = [sketch.age_customers[group].estimate() for group in AGE_GROUPS]
+    amounts = sketch.counts['age_group'].reindex(AGE_GROUPS, fill_value=0)
+    totals, sums = amounts['count'].to_numpy(dtype=float), amounts['sum'].to_numpy(dtype=float)
+    report = pd.DataFrame({
+        'age_group': AGE_GROUPS,
+        'customer_count': np.round(counts).astype(int),
+        'avg_purchase_amount': np.divide(sums, totals, out=np.full(len(sums), np.nan), where=totals > 0),
+    })
+    # HyperLogLog standard error; the averages are exact
+    relative_error = sketch.age_customers[AGE_GROUPS[0]].relative_error
+    report['customer_count_std_error'] = np.round(report['customer_count'] * relative_error, 1)
+    return report[totals > 0].reset_index(drop=True)
+
+def amount_quantiles(sketch, quantiles=(0.25, 0.5, 0.75, 0.9, 0.99)):
+    """Purchase amount quantiles, each within QUANTILE_ALPHA relative error."""
+    return pd.DataFrame({
+        'quantile': quantiles,
+        'total_amount': [sketch.amounts.quantile(q) for q in quantiles],
+        'relative_error': sketch.amounts.alpha,
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribution reports from mergeable sketches.")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild all daily sketches from the database first")
+    parser.add_argument('--exact', action='store_true', help="run the exact SQL reports instead")
+    parser.add_argument('--start', help="first day to include (YYYY-MM-DD)")
+    parser.add_argument('--end', help="last day to include (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    try:
+        if args.exact or args.rebuild:
+            print("Connecting to database...")
+            if ANALYTICS_ENGINE == 'duckdb':
+                connection = create_duckdb_connection()
+            else:
+                import mysql.connector
+                connection = mysql.connector.connect(
+                    host=os.getenv('DB_HOST', 'localhost'),
+                    user=os.getenv('DB_USER', 'root'),
+                    password=os.getenv('DB_PASSWORD', ''),
+                    database=os.getenv('DB_NAME', 'ecommerce_analysis')
+                )
+
+        if args.rebuild:
+            print("Building daily sketches...")
+            days = build_daily_sketches(read_sql(SKETCH_QUERY.format(where=''), connection), replace_all=True)
+            print(f"Built sketches for {days} days")
+
+        sketch = None
+        if not args.exact:
+            sketch = load_sketches(args.start, args.end)
+            if sketch is None:
+                print("No sketches found; run with --rebuild or --exact")
+                return
+            print(f"\nApproximate reports over {sketch.transactions} transactions, "
+                  f"~{sketch.customers.estimate():.0f} customers "
+                  f"(±{sketch.customers.relative_error:.2%})")
+
+        print("\nSales by Country:")
+        print("-" * 50)
+        print(country_sales_report(sketch, connection if sketch is None else None).to_string(index=False))
+        print("\nCustomer Age Distribution:")
+        print("-" * 50)
+        print(age_group_report(sketch, connection if sketch is None else None).to_string(index=False))
+        if sketch is not None:
+            print("\nPurchase Amount Quantiles:")
+            print("-" * 50)
+            print(amount_quantiles(sketch).to_string(index=False))
+
+    except Exception as e:
+        print(f"Error during reporting: {e}")
+    finally:
+        if 'connection' in locals():
+            connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import pandas as pd
+import numpy as np
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')  # Benchmarks render charts off-screen
+
+from sklearn.cluster import KMeans, DBSCAN
+
+from synthetic_data import write_synthetic_data, DEFAULT_SEED
+import data_preprocessing
+import customer_segmentation
+import predictive_analytics
+from duckdb_engine import create_duckdb_connection
+import model_registry
+from instrumentation import peak_rss_mb, reset_peak_rss
+
+# Configuration parameters
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+STAGE_TIMEOUT = 600              # Seconds before an isolated clustering stage is stopped
+DEFAULT_REPEAT = 3               # Timed runs per stage; the fastest is compared
+DEFAULT_TOLERANCE = 0.25         # Allowed slowdown against the baseline before flagging
+MIN_COMPARABLE_SECONDS = 0.1     # Ignore stages too fast to time reliably
+SHORT_STAGE_SECONDS = 1.0        # Stages faster than this in the baseline...
+SHORT_STAGE_TOLERANCE = 0.5      # ...are allowed at least this much slowdown
+DEFAULT_OUTPUT = os.path.join('benchmarks', 'results.json')
+
+def _fresh_args(args):
+    """Copy DataFrame and array arguments, so a repeated run never sees an earlier run's in-place edits."""
+    return [a.copy() if isinstance(a, (pd.DataFrame, pd.Series, np.ndarray)) else a for a in args]
+
+def run_stage(results, scale, stage, func, *args, rows=None, fatal=True, repeat=1, **kwargs):
+    """Time a pipeline function `repeat` times and append its record to results.
+
+    `seconds` is the fastest run, the one least disturbed by other load on
+    the machine, and `median_seconds` the median. With repeats, each run gets
+    its own copy of DataFrame and array arguments, made outside the timing.
+
+    Nothing traces allocations while the stage runs, so the time is the
+    stage's own. Memory comes from the OS: `rss_mb` is the process's peak
+    RSS during the stage and `peak_mb` its largest growth over the RSS at
+    the start of a run, which includes memory held by NumPy, DuckDB and
+    MySQL client buffers. Where the peak cannot be reset (non-Linux),
+    `peak_mb` only counts growth beyond earlier stages' peaks. Output printed
+    by the function is suppressed. A failing run ends the stage; it is
+    recorded and, when `fatal`, its exception re-raised.
+    """
+    status = 'ok'
+    value = error = None
+    timings = []
+    rss_peak = growth = 0.0
+    for _ in range(repeat):
+        call_args = _fresh_args(args) if repeat > 1 else args
+        reset_peak_rss()
+        rss_start = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                value = func(*call_args, **kwargs)
+        except Exception as e:
+            status = f"error: {e}"
+            error = e
+        timings.append(time.perf_counter() - start)
+        run_peak = peak_rss_mb()
+        rss_peak = max(rss_peak, run_peak)
+        growth = max(growth, run_peak - rss_start)
+        if error is not None:
+            break
+    elapsed = min(timings)
+
+    results.append({
+        'scale': scale,
+        'stage': stage,
+        'seconds': round(elapsed, 4),
+        'median_seconds': round(float(np.median(timings)), 4),
+        'runs': len(timings),
+        'peak_mb': round(growth, 2),
+        'rss_mb': round(rss_peak, 2),
+        'rows': rows,
+        'status': status,
+    })
+    print(f"  {stage:<28} {elapsed:>9.3f}s {growth:>10.1f} MB  {status}")
+    if error is not None and fatal:
+        # Later stages depend on this one's output, so abandon the scale
+        raise error
+    return value
+
+def _isolated_stage(connection, registry_enabled, scale, stage, func, args, rows, repeat):
+    """Child-process side of run_isolated_stage: run the stage and send back its record."""
+    model_registry.MODEL_REGISTRY_ENABLED = registry_enabled
+    records = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_stage(records, scale, stage, func, *args, rows=rows, fatal=False, repeat=repeat)
+    connection.send(records[0])
+    connection.close()
+
+def run_isolated_stage(results, scale, stage, func, *args, rows=None, timeout=STAGE_TIMEOUT, repeat=1):
+    """Run a stage in a child process, so a timeout or out-of-memory kill is recorded, not fatal.
+
+    Used for stages whose cost can grow quadratically with the number of
+    customers. The timeout covers all `repeat` runs. The return value is not
+    passed back.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_isolated_stage, args=(
+        sender, model_registry.MODEL_REGISTRY_ENABLED, scale, stage, func, args, rows, repeat))
+    process.start()
+    sender.close()
+
+    record = status = None
+    try:
+        if receiver.poll(timeout):
+            record = receiver.recv()
+    except EOFError:
+        pass  # The child died before sending its record
+    if record is None and process.is_alive():
+        process.kill()
+        status = f"timeout after {timeout:g}s"
+    process.join()
+    receiver.close()
+    if record is None and status is None:
+        status = f"error: killed (exit code {process.exitcode}), likely out of memory"
+
+    if record is None:
+        record = {'scale': scale, 'stage': stage, 'seconds': None, 'median_seconds': None, 'runs': 0,
+                  'peak_mb': None, 'rss_mb': None, 'rows': rows, 'status': status}
+        print(f"  {stage:<28} {'-':>10} {'-':>13}  {status}")
+    else:
+        print(f"  {stage:<28} {record['seconds']:>9.3f}s {record['peak_mb']:>10.1f} MB  {record['status']}")
+    results.append(record)
+
+def _fit_kmeans(scaled_features):
+    """K-means fit alone, without the quadratic silhouette scoring."""
+    return KMeans(n_clusters=customer_segmentation.KMEANS_N_CLUSTERS, random_state=42).fit_predict(scaled_features)
+
+def _fit_dbscan(scaled_features):
+    """DBSCAN fit alone, without the quadratic silhouette scoring."""
+    return DBSCAN(eps=customer_segmentation.DBSCAN_EPS,
+                  min_samples=customer_segmentation.DBSCAN_MIN_SAMPLES).fit_predict(scaled_features)
+
+def skip_stage(results, scale, stage, reason):
+    """Record a stage that was not run at this scale."""
+    results.append({'scale': scale, 'stage': stage, 'seconds': None, 'median_seconds': None, 'runs': 0,
+                    'peak_mb': None, 'rss_mb': None, 'rows': None, 'status': f"skipped: {reason}"})
+    print(f"  {stage:<28} {'-':>10} {'-':>13}  skipped: {reason}")
+
+def benchmark_scale(results, scale, workdir, seed=DEFAULT_SEED, mysql_connection=None,
+                    stage_timeout=STAGE_TIMEOUT, repeat=DEFAULT_REPEAT):
+    """Generate `scale` rows and time every pipeline stage on them.
+
+    Each stage is timed `repeat` times, except data generation and the MySQL
+    load, which write their output and run once.
+    """
+    csv_path = os.path.join(workdir, f'transactions_{scale}.csv')
+    print(f"\nScale {scale:,} rows")
+    print("-" * 70)
+
+    run_stage(results, scale, 'generate_synthetic_data', write_synthetic_data, csv_path, scale, seed=seed, rows=scale)
+    df = run_stage(results, scale, 'load_data', data_preprocessing.load_data, csv_path, rows=scale, repeat=repeat)
+    df = run_stage(results, scale, 'clean_data', data_preprocessing.clean_data, df, rows=len(df), repeat=repeat)
+
+    if mysql_connection is not None:
+        from setup_database import create_tables
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_tables(mysql_connection)
+        run_stage(results, scale, 'load_to_database', data_preprocessing.load_to_database,
+                  df, mysql_connection, rows=len(df))
+    else:
+        skip_stage(results, scale, 'load_to_database', "no --mysql")
+
+    # Analytical reads go through the embedded engine so no server is needed
+    connection = create_duckdb_connection(csv_path)
+    try:
+        features = run_stage(results, scale, 'get_customer_features',
+                             customer_segmentation.get_customer_features, connection, rows=len(df), repeat=repeat)
+        scaled = run_stage(results, scale, 'prepare_features',
+                           customer_segmentation.prepare_features, features, rows=len(features), repeat=repeat)
+        scaled_features = scaled[0]
+
+        # Fits are timed apart from the full functions, whose silhouette scoring
+        # is quadratic; each runs isolated so a timeout or OOM only loses that stage
+        customers = len(scaled_features)
+        for stage, func in [('kmeans_fit', _fit_kmeans),
+                            ('perform_kmeans_clustering', customer_segmentation.perform_kmeans_clustering),
+                            ('dbscan_fit', _fit_dbscan),
+                            ('perform_dbscan_clustering', customer_segmentation.perform_dbscan_clustering)]:
+            run_isolated_stage(results, scale, stage, func, scaled_features, rows=customers,
+                               timeout=stage_timeout, repeat=repeat)
+
+        data = run_stage(results, scale, 'get_data', predictive_analytics.get_data, connection, rows=len(df),
+                         repeat=repeat)
+    finally:
+        connection.close()
+
+    daily_sales = run_stage(results, scale, 'prepare_time_series_data',
+                            predictive_analytics.prepare_time_series_data, data, rows=len(data), repeat=repeat)
+    # Nothing downstream uses the forecast, so a failure should not hide the LTV timing
+    run_stage(results, scale, 'forecast_sales', predictive_analytics.forecast_sales,
+              daily_sales, rows=len(daily_sales), fatal=False, repeat=repeat)
+    run_stage(results, scale, 'calculate_customer_ltv', predictive_analytics.calculate_customer_ltv,
+              data, rows=len(data), fatal=False, repeat=repeat)
+
+    os.remove(csv_path)
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return the stages that got slower than the baseline by more than tolerance.
+
+    Compares each stage's fastest run. Stages that take under
+    MIN_COMPARABLE_SECONDS in both runs are skipped, and sub-second stages
+    are allowed at least SHORT_STAGE_TOLERANCE, since process-to-process
+    noise alone can exceed the tolerance there.
+    """
+    baseline_seconds = {
+        (r['scale'], r['stage']): r['seconds'] for r in baseline['results'] if r.get('seconds') is not None
+    }
+
+    regressions = []
+    for r in results:
+        before = baseline_seconds.get((r['scale'], r['stage']))
+        if before is None or r['seconds'] is None:
+            continue
+        if max(before, r['seconds']) < MIN_COMPARABLE_SECONDS:
+            continue
+        allowed = max(tolerance, SHORT_STAGE_TOLERANCE) if before < SHORT_STAGE_SECONDS else tolerance
+        if r['seconds'] > before * (1 + allowed):
+            regressions.append({
+                'scale': r['scale'],
+                'stage': r['stage'],
+                'baseline_seconds': before,
+                'seconds': r['seconds'],
+                'slowdown': round(r['seconds'] / before, 2) if before else float('inf'),
+            })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on synthetic data at several scales.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="where to write the JSON results")
+    parser.add_argument('--baseline', help="JSON results from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="timed runs per stage; the fastest is reported and compared")
+    parser.add_argument('--stage-timeout', type=float, default=STAGE_TIMEOUT,
+                        help="seconds before a clustering stage is stopped and recorded as a timeout")
+    parser.add_argument('--mysql', action='store_true',
+                        help="also time load_to_database; drops and recreates the tables in "
+                             "BENCHMARK_DB_NAME, so never point it at real data")
+    parser.add_argument('--use-registry', action='store_true',
+                        help="let stages reuse registered models instead of always training")
+    args = parser.parse_args()
+
+    # Timings should reflect training unless reuse is what is being measured
+    model_registry.MODEL_REGISTRY_ENABLED = args.use_registry
+
+    mysql_connection = None
+    if args.mysql:
+        import mysql.connector
+        mysql_connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('BENCHMARK_DB_NAME', 'ecommerce_benchmark')
+        )
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    original_cwd = os.getcwd()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # Charts written by the pipeline land in the scratch directory
+            os.chdir(workdir)
+            for scale in args.scales:
+                try:
+                    benchmark_scale(results, scale, workdir, seed=args.seed, mysql_connection=mysql_connection,
+                                    stage_timeout=args.stage_timeout, repeat=args.repeat)
+                except Exception as e:
+                    print(f"Scale {scale:,} aborted: {e}")
+    finally:
+        os.chdir(original_cwd)
+        if mysql_connection is not None:
+            mysql_connection.close()
+
+    report = {
+        'metadata': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'seed': args.seed,
+            'scales': args.scales,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions (> {args.tolerance:.0%} slower than baseline):")
+            print(pd.DataFrame(regressions).to_string(index=False))
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ from sklearn.metrics import silhouette_score, calinski_harabasz_score
 import mysql.connector
 from dotenv import load_dotenv
 import os
+from duckdb_engine import ANALYTICS_ENGINE, create_duckdb_connection, read_sql
+from instrumentation import instrument, save_metrics_to_database
+from model_registry import fingerprint_data, register_model, load_latest_model, save_models_to_database
+from rfm_scoring import resolve_as_of_date
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +19,7 @@ KMEANS_N_CLUSTERS = 5  # Number of customer segments to create
 DBSCAN_EPS = 0.5      # Maximum distance between samples to be considered neighbors
 DBSCAN_MIN_SAMPLES = 5  # Minimum number of samples in a neighborhood to form a cluster
 
-def get_customer_features(connection):
-    """Extract customer features from database."""
-    query = """
+CUSTOMER_FEATURES_QUERY = """
     SELECT 
         customer_id,
         COUNT(DISTINCT transaction_id) as transaction_count,
@@ -28,14 +30,23 @@ def get_customer_features(connection):
     FROM transactions
     GROUP BY customer_id
     """
-    
-    df = pd.read_sql(query, connection)
+
+@instrument()
+def get_customer_features(connection):
+    """Extract customer features from database (MySQL or DuckDB connection)."""
+    df = read_sql(CUSTOMER_FEATURES_QUERY, connection)
     return df
 
-def prepare_features(df):
-    """Prepare features for clustering."""
+@instrument()
+def prepare_features(df, as_of_date=None):
+    """Prepare features for clustering.
+    
+    Recency is measured from a fixed as-of date (see rfm_scoring.resolve_as_of_date)
+    rather than the current time, so results are reproducible.
+    """
     # Calculate days since last purchase
-    df['days_since_last_purchase'] = (pd.Timestamp.now() - pd.to_datetime(df['last_purchase_date'])).dt.days
+    as_of = resolve_as_of_date(df['last_purchase_date'], as_of_date)
+    df['days_since_last_purchase'] = (as_of - pd.to_datetime(df['last_purchase_date'])).dt.days
     
     # Select features for clustering
     features = ['transaction_count', 'total_spent', 'avg_transaction_value', 
@@ -47,9 +58,13 @@ def prepare_features(df):
     
     return scaled_features, features
 
-def perform_kmeans_clustering(scaled_features, n_clusters=KMEANS_N_CLUSTERS):
+@instrument()
+def perform_kmeans_clustering(scaled_features, n_clusters=KMEANS_N_CLUSTERS, feature_names=None):
     """Perform K-means clustering.
     
+    A model already trained on identical features is loaded from the model
+    registry instead of being refit and rescored.
+    
     Parameters:
     -----------
     scaled_features : array-like
@@ -58,7 +73,18 @@ def perform_kmeans_clustering(scaled_features, n_clusters=KMEANS_N_CLUSTERS):
         Number of clusters to form. This determines the number of customer segments.
         A value of 5 is recommended for e-commerce analysis as it provides a good
         balance between granularity and interpretability.
+    feature_names : list of str, optional
+        Column names of scaled_features, recorded as the model's feature schema.
     """
+    scaled_features = np.asarray(scaled_features)
+    feature_schema = {'features': feature_names, 'n_features': scaled_features.shape[1], 'n_clusters': n_clusters}
+    fingerprint = fingerprint_data(scaled_features)
+    
+    cached = load_latest_model('customer_kmeans', fingerprint, feature_schema)
+    if cached is not None:
+        kmeans, metadata = cached
+        return np.asarray(kmeans.labels_), metadata['metrics']['silhouette'], metadata['metrics']['calinski_harabasz']
+    
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     kmeans_labels = kmeans.fit_predict(scaled_features)
     
@@ -66,8 +92,13 @@ def perform_kmeans_clustering(scaled_features, n_clusters=KMEANS_N_CLUSTERS):
     silhouette = silhouette_score(scaled_features, kmeans_labels)
     calinski = calinski_harabasz_score(scaled_features, kmeans_labels)
     
+    register_model('customer_kmeans', 'KMeans', kmeans,
+                   {'silhouette': silhouette, 'calinski_harabasz': calinski},
+                   fingerprint, feature_schema, accuracy_metric='silhouette')
+    
     return kmeans_labels, silhouette, calinski
 
+@instrument()
 def perform_dbscan_clustering(scaled_features, eps=DBSCAN_EPS, min_samples=DBSCAN_MIN_SAMPLES):
     """Perform DBSCAN clustering.
     
@@ -89,7 +120,7 @@ def perform_dbscan_clustering(scaled_features, eps=DBSCAN_EPS, min_samples=DBSCA
     
     # Calculate clustering metrics (excluding noise points)
     mask = dbscan_labels != -1
-    if sum(mask) > 1:  # Need at least 2 clusters for metrics
+    if len(np.unique(dbscan_labels[mask])) > 1:  # Need at least 2 clusters for metrics
         silhouette = silhouette_score(scaled_features[mask], dbscan_labels[mask])
         calinski = calinski_harabasz_score(scaled_features[mask], dbscan_labels[mask])
     else:
@@ -97,6 +128,7 @@ def perform_dbscan_clustering(scaled_features, eps=DBSCAN_EPS, min_samples=DBSCA
     
     return dbscan_labels, silhouette, calinski
 
+@instrument()
 def save_segments_to_database(df, kmeans_labels, dbscan_labels, connection):
     """Save clustering results to database."""
     cursor = connection.cursor()
@@ -148,14 +180,17 @@ def main():
         database=os.getenv('DB_NAME', 'ecommerce_analysis')
     )
     
+    # Read features through the configured engine; segments are still written to MySQL
+    analytics_connection = create_duckdb_connection() if ANALYTICS_ENGINE == 'duckdb' else connection
+    
     # Get customer features
-    df = get_customer_features(connection)
+    df = get_customer_features(analytics_connection)
     
     # Prepare features for clustering
     scaled_features, features = prepare_features(df)
     
     # Perform K-means clustering
-    kmeans_labels, kmeans_silhouette, kmeans_calinski = perform_kmeans_clustering(scaled_features)
+    kmeans_labels, kmeans_silhouette, kmeans_calinski = perform_kmeans_clustering(scaled_features, feature_names=features)
     analyze_segments(df, kmeans_labels, "K-means")
     
     # Perform DBSCAN clustering
@@ -175,6 +210,11 @@ def main():
     print(f"Silhouette Score: {dbscan_silhouette:.4f}")
     print(f"Calinski-Harabasz Score: {dbscan_calinski:.4f}")
     
+    save_models_to_database(connection)
+    save_metrics_to_database(connection)
+    
+    if analytics_connection is not connection:
+        analytics_connection.close()
     connection.close()
     print("\nCustomer segmentation completed successfully!")
 
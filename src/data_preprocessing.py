@@ -3,24 +3,36 @@ import numpy as np
 from datetime import datetime
 import mysql.connector
 from dotenv import load_dotenv
+import json
 import os
+from duckdb_engine import ANALYTICS_ENGINE, DUCKDB_SOURCE, export_to_parquet, update_parquet_export
+from instrumentation import instrument, save_metrics_to_database
+from incremental_ingest import (INGEST_MODE, INGEST_STATE_DIR, read_new_rows, upsert_transactions,
+                                reset_ingest_state, record_full_load, row_hashes, affected_days)
+from approximate_reports import APPROXIMATE_REPORTS, build_daily_sketches, refresh_daily_sketches
 
 # Load environment variables
 load_dotenv()
 
+# Age median and amount quartiles from the last full load, reused by incremental batches
+CLEANING_STATS_PATH = os.path.join(INGEST_STATE_DIR, 'cleaning_stats.json')
+
+def find_data_file(file_path):
+    """Resolve a data file given as-is, relative to data/, or relative to the project root."""
+    # Try the provided path first
+    if os.path.exists(file_path):
+        return file_path
+    # Try in data directory
+    if os.path.exists(os.path.join('data', file_path)):
+        return os.path.join('data', file_path)
+    # Try in root directory
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), file_path)
+
+@instrument()
 def load_data(file_path):
     """Load the e-commerce transactions dataset."""
     try:
-        # Try the provided path first
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-        # Try in data directory
-        elif os.path.exists(os.path.join('data', file_path)):
-            df = pd.read_csv(os.path.join('data', file_path))
-        # Try in root directory
-        else:
-            root_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), file_path)
-            df = pd.read_csv(root_path)
+        df = pd.read_csv(find_data_file(file_path))
         
         # Print column names for debugging
         print("\nAvailable columns in the dataset:")
@@ -33,27 +45,87 @@ def load_data(file_path):
         print(f"Error loading data: {e}")
         raise
 
-def clean_data(df):
-    """Clean and preprocess the data."""
+def _fill_missing(df, age_median):
+    """Fill missing Age with the given median and missing categories with 'Unknown'."""
+    df['Age'] = df['Age'].fillna(age_median)
+    df['Country'] = df['Country'].fillna('Unknown')
+    df['Payment_Method'] = df['Payment_Method'].fillna('Unknown')
+    return df
+
+def cleaning_stats(df):
+    """Compute the Age median and Purchase_Amount quartiles clean_data uses.
+
+    Taken from a full load and reused for incremental batches, so a small
+    batch is not filled or filtered by its own statistics.
+    """
+    age_median = df['Age'].median()
+    filled = _fill_missing(df.copy(), age_median)
+    filled['Transaction_Date'] = pd.to_datetime(filled['Transaction_Date'])
+    amounts = filled.drop_duplicates()['Purchase_Amount']
+    return {
+        'age_median': float(age_median),
+        'q1': float(amounts.quantile(0.25)),
+        'q3': float(amounts.quantile(0.75)),
+    }
+
+def load_cleaning_stats(path=CLEANING_STATS_PATH):
+    """Read the statistics saved by the last full load, or None if there are none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_cleaning_stats(stats, path=CLEANING_STATS_PATH):
+    """Persist cleaning statistics for later incremental batches."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+@instrument()
+def clean_data(df, stats=None):
+    """Clean and preprocess the data.
+    
+    Missing ages and outliers are judged against `stats` (see cleaning_stats)
+    when given, otherwise against df itself.
+    """
+    if stats is None:
+        stats = cleaning_stats(df)
+    
     # Convert transaction date to datetime
     df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date'])
     
     # Handle missing values
-    df['Age'] = df['Age'].fillna(df['Age'].median())
-    df['Country'] = df['Country'].fillna('Unknown')
-    df['Payment_Method'] = df['Payment_Method'].fillna('Unknown')
+    df = _fill_missing(df, stats['age_median'])
     
     # Remove duplicates
     df = df.drop_duplicates()
     
     # Remove outliers in numerical columns
-    Q1 = df['Purchase_Amount'].quantile(0.25)
-    Q3 = df['Purchase_Amount'].quantile(0.75)
+    Q1 = stats['q1']
+    Q3 = stats['q3']
     IQR = Q3 - Q1
     df = df[~((df['Purchase_Amount'] < (Q1 - 1.5 * IQR)) | (df['Purchase_Amount'] > (Q3 + 1.5 * IQR)))]
     
     return df
 
+def map_to_schema(df):
+    """Map cleaned CSV columns onto the transactions table, as load_to_database does row by row."""
+    return pd.DataFrame({
+        'transaction_id': df['Transaction_ID'],
+        'customer_id': df['Transaction_ID'],  # no separate customer id in the data
+        'transaction_date': df['Transaction_Date'],
+        'product_id': df['Transaction_ID'],  # no separate product id in the data
+        'product_category': df['Product_Category'],
+        'quantity': 1,
+        'unit_price': df['Purchase_Amount'],
+        'total_amount': df['Purchase_Amount'],
+        'country': df['Country'],
+        'payment_method': df['Payment_Method'],
+        'customer_age': df['Age'],
+    })
+
 def create_database_connection():
     """Create connection to MySQL database."""
     connection = mysql.connector.connect(
@@ -64,12 +136,16 @@ def create_database_connection():
     )
     return connection
 
+@instrument()
 def load_to_database(df, connection):
     """Load processed data into MySQL database."""
     cursor = connection.cursor()
     
+    # Stored so incremental ingest can tell unchanged rows from changed ones
+    hashes = row_hashes(map_to_schema(df))
+    
     # Prepare data for insertion
-    for _, row in df.iterrows():
+    for (_, row), row_hash in zip(df.iterrows(), hashes):
         # Map the data to match our database schema
         values = (
             row['Transaction_ID'],  # transaction_id
@@ -82,14 +158,15 @@ def load_to_database(df, connection):
             row['Purchase_Amount'],  # total_amount (using Purchase_Amount as total_amount)
             row['Country'],  # country
             row['Payment_Method'],  # payment_method
-            row['Age']  # customer_age
+            row['Age'],  # customer_age
+            int(row_hash)  # row_hash
         )
         
         sql = """INSERT INTO transactions 
                 (transaction_id, customer_id, transaction_date, product_id, 
                 product_category, quantity, unit_price, total_amount, 
-                country, payment_method, customer_age)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+                country, payment_method, customer_age, row_hash)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
         
         try:
             cursor.execute(sql, values)
@@ -101,15 +178,63 @@ def load_to_database(df, connection):
     connection.commit()
     cursor.close()
 
+def ingest_incrementally(file_path):
+    """Load only new or changed rows of a source file and log the changes."""
+    connection = create_database_connection()
+    try:
+        print("Reading new rows...")
+        df, file_state = read_new_rows(find_data_file(file_path), connection)
+        if df.empty:
+            print("No new rows since the last ingest.")
+            return
+        
+        # Fill and filter with the full load's statistics, not this batch's
+        stats = load_cleaning_stats()
+        if stats is None:
+            # Nothing loaded yet, so this batch is the initial load
+            stats = cleaning_stats(df)
+            save_cleaning_stats(stats)
+        print(f"Cleaning {len(df)} new rows...")
+        df_cleaned = clean_data(df, stats)
+        
+        print("Upserting changed transactions...")
+        changes = upsert_transactions(map_to_schema(df_cleaned), connection, file_state)
+        
+        # Keep the DuckDB engine's Parquet copy in step with MySQL
+        if ANALYTICS_ENGINE == 'duckdb' and DUCKDB_SOURCE.lower().endswith('.parquet') and not changes.empty:
+            print(f"Updating {DUCKDB_SOURCE}...")
+            update_parquet_export(df_cleaned, DUCKDB_SOURCE)
+        
+        # Only the days touched by this batch need new sketches
+        if APPROXIMATE_REPORTS and not changes.empty:
+            print("Refreshing daily sketches...")
+            refresh_daily_sketches(connection, affected_days(changes))
+        save_metrics_to_database(connection)
+        
+        print("Incremental ingest completed successfully!")
+    finally:
+        connection.close()
+
 def main():
     try:
+        if INGEST_MODE == 'incremental':
+            ingest_incrementally('ecommerce_transactions.csv')
+            return
+        
         # Load data
         print("Loading data...")
-        df = load_data('ecommerce_transactions.csv')
+        data_file = find_data_file('ecommerce_transactions.csv')
+        df = load_data(data_file)
         
         # Clean data
         print("Cleaning data...")
-        df_cleaned = clean_data(df)
+        stats = cleaning_stats(df)
+        df_cleaned = clean_data(df, stats)
+        
+        # Keep a columnar copy for the DuckDB engine when it reads Parquet
+        if ANALYTICS_ENGINE == 'duckdb' and DUCKDB_SOURCE.lower().endswith('.parquet'):
+            print(f"Exporting cleaned data to {DUCKDB_SOURCE}...")
+            export_to_parquet(df_cleaned, DUCKDB_SOURCE)
         
         # Create database connection
         print("Connecting to database...")
@@ -118,6 +243,14 @@ def main():
         # Load data to database
         print("Loading data to database...")
         load_to_database(df_cleaned, connection)
+        reset_ingest_state()
+        save_cleaning_stats(stats)
+        record_full_load(data_file, connection, len(df))
+        
+        if APPROXIMATE_REPORTS:
+            print("Building daily sketches...")
+            build_daily_sketches(map_to_schema(df_cleaned), replace_all=True)
+        save_metrics_to_database(connection)
         
         # Close connection
         connection.close()
@@ -0,0 +1,272 @@
+import pandas as pd
+import time
+from dotenv import load_dotenv
+import os
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is optional; only needed when ANALYTICS_ENGINE=duckdb
+    duckdb = None
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'mysql').lower()  # 'mysql' or 'duckdb'
+DUCKDB_SOURCE = os.getenv('DUCKDB_SOURCE', os.path.join('data', 'ecommerce_transactions.csv'))
+DUCKDB_THREADS = os.getenv('DUCKDB_THREADS')  # Defaults to all cores when unset
+
+# Maps the raw CSV columns onto the transactions table schema, mirroring load_to_database
+TRANSACTIONS_PROJECTION = """
+SELECT
+    CAST(Transaction_ID AS VARCHAR) AS transaction_id,
+    CAST(Transaction_ID AS VARCHAR) AS customer_id,
+    CAST(Transaction_Date AS TIMESTAMP) AS transaction_date,
+    CAST(Transaction_ID AS VARCHAR) AS product_id,
+    Product_Category AS product_category,
+    1 AS quantity,
+    CAST(Purchase_Amount AS DOUBLE) AS unit_price,
+    CAST(Purchase_Amount AS DOUBLE) AS total_amount,
+    Country AS country,
+    Payment_Method AS payment_method,
+    CAST(Age AS INTEGER) AS customer_age
+FROM {relation}
+"""
+
+# Same cleaning rules as data_preprocessing.clean_data, expressed in SQL
+CLEAN_RAW_TRANSACTIONS = """
+WITH filled AS (
+    SELECT DISTINCT * REPLACE (
+        COALESCE(Age, (SELECT median(Age) FROM raw_transactions)) AS Age,
+        COALESCE(Country, 'Unknown') AS Country,
+        COALESCE(Payment_Method, 'Unknown') AS Payment_Method
+    )
+    FROM raw_transactions
+),
+bounds AS (
+    SELECT
+        quantile_cont(Purchase_Amount, 0.25) AS q1,
+        quantile_cont(Purchase_Amount, 0.75) AS q3
+    FROM filled
+)
+SELECT filled.*
+FROM filled, bounds
+WHERE NOT (Purchase_Amount < q1 - 1.5 * (q3 - q1)
+           OR Purchase_Amount > q3 + 1.5 * (q3 - q1))
+"""
+
+def _require_duckdb():
+    """Raise a helpful error when DuckDB is not installed."""
+    if duckdb is None:
+        raise ImportError("ANALYTICS_ENGINE=duckdb requires the 'duckdb' package (pip install duckdb pyarrow)")
+
+def _resolve_source(source):
+    """Find the data file in the same places load_data looks."""
+    if os.path.exists(source):
+        return source
+    root_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), source)
+    if os.path.exists(root_path):
+        return root_path
+    raise FileNotFoundError(f"DuckDB source not found: {source}")
+
+def is_duckdb_connection(connection):
+    """Return True if the connection belongs to the embedded DuckDB engine."""
+    return duckdb is not None and isinstance(connection, duckdb.DuckDBPyConnection)
+
+def create_duckdb_connection(source=DUCKDB_SOURCE):
+    """Create an in-process DuckDB connection exposing a `transactions` table.
+
+    Parameters:
+    -----------
+    source : str
+        Path to the raw transactions CSV or to a Parquet file written by
+        export_to_parquet. A CSV is cleaned and mapped onto the transactions
+        schema in SQL; a Parquet file is assumed to already be in that schema.
+    """
+    _require_duckdb()
+    path = _resolve_source(source).replace("'", "''")
+
+    connection = duckdb.connect(database=':memory:')
+    if DUCKDB_THREADS:
+        connection.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+
+    if path.lower().endswith('.parquet'):
+        # Parquet is scanned lazily, so only the columns a query touches are read
+        connection.execute(f"CREATE VIEW transactions AS SELECT * FROM read_parquet('{path}')")
+    else:
+        # Materialize the cleaned CSV once as an in-memory columnar table
+        connection.execute(f"CREATE VIEW raw_transactions AS SELECT * FROM read_csv_auto('{path}', header = true)")
+        connection.execute(f"CREATE VIEW cleaned_transactions AS {CLEAN_RAW_TRANSACTIONS}")
+        connection.execute(
+            "CREATE TABLE transactions AS " + TRANSACTIONS_PROJECTION.format(relation='cleaned_transactions')
+        )
+    return connection
+
+def read_sql(query, connection, arrow=False, params=None):
+    """Run a query on either engine and return a DataFrame.
+
+    MySQL connections go through pd.read_sql. DuckDB connections return the
+    result directly as a pandas DataFrame, or as a pyarrow Table when
+    `arrow` is True, without a row-by-row conversion. Queries use MySQL-style
+    %s placeholders for `params` on both engines.
+    """
+    if is_duckdb_connection(connection):
+        result = connection.execute(query.replace('%s', '?'), params) if params else connection.execute(query)
+        return result.arrow() if arrow else result.df()
+    return pd.read_sql(query, connection, params=params)
+
+def aggregate_frame(df, query):
+    """Run a SQL aggregation over an in-memory DataFrame with DuckDB.
+
+    The frame is registered as the relation `df`, so DuckDB scans the pandas
+    columns in place and runs the GROUP BY multi-threaded.
+    """
+    _require_duckdb()
+    connection = duckdb.connect(database=':memory:')
+    if DUCKDB_THREADS:
+        connection.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+    try:
+        connection.register('df', df)
+        return connection.execute(query).df()
+    finally:
+        connection.close()
+
+def export_to_parquet(df, path):
+    """Write cleaned transactions to Parquet in the transactions table schema."""
+    _require_duckdb()
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    connection = duckdb.connect(database=':memory:')
+    try:
+        connection.register('cleaned_transactions', df)
+        query = TRANSACTIONS_PROJECTION.format(relation='cleaned_transactions')
+        escaped_path = path.replace("'", "''")
+        connection.execute(f"COPY ({query}) TO '{escaped_path}' (FORMAT PARQUET)")
+    finally:
+        connection.close()
+
+def update_parquet_export(df, path):
+    """Upsert cleaned transactions into an existing Parquet export by transaction_id.
+
+    The file is rewritten through a temporary copy, so readers never see a
+    partial export. Without an existing file this is export_to_parquet.
+    """
+    if not os.path.exists(path):
+        export_to_parquet(df, path)
+        return
+    _require_duckdb()
+    batch = df.drop_duplicates('Transaction_ID', keep='last')
+    temp_path = path + '.tmp'
+    connection = duckdb.connect(database=':memory:')
+    try:
+        connection.register('cleaned_transactions', batch)
+        connection.execute(
+            "CREATE TEMP TABLE batch AS " + TRANSACTIONS_PROJECTION.format(relation='cleaned_transactions')
+        )
+        escaped_path = path.replace("'", "''")
+        escaped_temp = temp_path.replace("'", "''")
+        connection.execute(f"""
+            COPY (
+                SELECT * FROM read_parquet('{escaped_path}') AS existing
+                WHERE NOT EXISTS (SELECT 1 FROM batch WHERE batch.transaction_id = existing.transaction_id)
+                UNION ALL
+                SELECT * FROM batch
+            ) TO '{escaped_temp}' (FORMAT PARQUET)
+        """)
+    finally:
+        connection.close()
+    os.replace(temp_path, path)
+
+def run_report_queries(connection, path=os.path.join('sql', 'queries.sql'), titles=None):
+    """Run the reports in sql/queries.sql and return them keyed by title.
+
+    Pass `titles` to run only those reports. Reports that reference tables
+    the engine does not have (for example customer_segments on a DuckDB
+    connection) are skipped.
+    """
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(os.path.dirname(__file__)), path)
+    with open(path) as f:
+        statements = [s.strip() for s in f.read().split(';') if s.strip()]
+
+    reports = {}
+    for statement in statements:
+        lines = statement.splitlines()
+        title = lines[0].lstrip('- ').strip() if lines[0].startswith('--') else f"Report {len(reports) + 1}"
+        if titles is not None and title not in titles:
+            continue
+        try:
+            reports[title] = read_sql(statement, connection)
+        except Exception as e:
+            print(f"Skipping report '{title}': {str(e).splitlines()[0]}")
+    return reports
+
+def benchmark_engines(mysql_connection, duckdb_connection, repeat=3):
+    """Time the main analytical reads on both engines and print a comparison."""
+    # Imported here so the analysis modules can import this one without cycles
+    from customer_segmentation import CUSTOMER_FEATURES_QUERY
+
+    benchmarks = {
+        'customer_features': CUSTOMER_FEATURES_QUERY,
+        'daily_sales': """
+            SELECT transaction_date, SUM(total_amount) AS total_amount
+            FROM transactions
+            GROUP BY transaction_date
+            ORDER BY transaction_date
+        """,
+        'sales_by_country': """
+            SELECT country, COUNT(DISTINCT transaction_id) AS total_transactions,
+                   SUM(total_amount) AS total_sales
+            FROM transactions
+            GROUP BY country
+        """,
+    }
+
+    results = []
+    for name, query in benchmarks.items():
+        row = {'query': name}
+        for engine, connection in (('mysql', mysql_connection), ('duckdb', duckdb_connection)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                read_sql(query, connection)
+                timings.append(time.perf_counter() - start)
+            row[f'{engine}_seconds'] = min(timings)
+        row['speedup'] = row['mysql_seconds'] / row['duckdb_seconds'] if row['duckdb_seconds'] else float('nan')
+        results.append(row)
+
+    results = pd.DataFrame(results)
+    print("\nEngine Benchmark (best of {} runs):".format(repeat))
+    print("-" * 50)
+    print(results.to_string(index=False))
+    return results
+
+def main():
+    import mysql.connector
+
+    try:
+        print("Connecting to MySQL...")
+        mysql_connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('DB_NAME', 'ecommerce_analysis')
+        )
+
+        print(f"Loading {DUCKDB_SOURCE} into DuckDB...")
+        duckdb_connection = create_duckdb_connection()
+
+        benchmark_engines(mysql_connection, duckdb_connection)
+
+    except Exception as e:
+        print(f"Error during benchmark: {e}")
+    finally:
+        if 'mysql_connection' in locals():
+            mysql_connection.close()
+        if 'duckdb_connection' in locals():
+            duckdb_connection.close()
+
+if __name__ == "__main__":
+    main()
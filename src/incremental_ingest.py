@@ -0,0 +1,359 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import io
+import math
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+
+from duckdb_engine import read_sql
+from instrumentation import instrument
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters
+INGEST_MODE = os.getenv('INGEST_MODE', 'full').lower()  # 'full' (drop and reload) or 'incremental'
+INGEST_STATE_DIR = os.getenv('INGEST_STATE_DIR', os.path.join('data', '.ingest'))
+BLOOM_CAPACITY = 10_000_000       # Expected transaction ids before the filter is rebuilt larger
+BLOOM_ERROR_RATE = 0.01           # False-positive rate; false positives only cost a key lookup
+LOOKUP_BATCH_SIZE = 1_000         # Ids per IN (...) lookup of possibly-existing keys
+WRITE_BATCH_SIZE = 10_000         # Rows per bulk upsert
+FINGERPRINT_WINDOW = 64 * 1024    # Bytes hashed at the start and end of the loaded region
+
+TRANSACTION_COLUMNS = ['transaction_id', 'customer_id', 'transaction_date', 'product_id',
+                       'product_category', 'quantity', 'unit_price', 'total_amount',
+                       'country', 'payment_method', 'customer_age']
+
+class BloomFilter:
+    """Bit-packed Bloom filter over transaction ids, with vectorized add and lookup.
+
+    Answers "definitely not loaded" or "maybe loaded"; only the maybe-loaded
+    ids need a key lookup in MySQL.
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = int(capacity)
+        self.error_rate = error_rate
+        self.n_bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys):
+        # Double hashing with the two halves of one 64-bit hash (Kirsch-Mitzenmacher)
+        hashes = pd.util.hash_array(pd.Series(keys, dtype=object).astype(str).to_numpy(dtype=object))
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.n_bits)
+
+    def add(self, keys):
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        self.count += len(keys)
+
+    def might_contain(self, keys):
+        positions = self._positions(keys)
+        bytes_ = self.bits[(positions >> np.uint64(3)).astype(np.int64)]
+        present = (bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+        return present.all(axis=1)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        np.savez(path, bits=self.bits, meta=np.array([self.capacity, self.count], dtype=np.int64),
+                 error_rate=np.array([self.error_rate]))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        capacity, count = data['meta'].tolist()
+        bloom = cls(capacity, float(data['error_rate'][0]))
+        bloom.bits = data['bits']
+        bloom.count = count
+        return bloom
+
+def _bloom_path():
+    return os.path.join(INGEST_STATE_DIR, 'transaction_ids.bloom.npz')
+
+def load_key_filter(connection):
+    """Load the transaction id filter, rebuilding it from MySQL if missing or full."""
+    path = _bloom_path()
+    if os.path.exists(path):
+        bloom = BloomFilter.load(path)
+        if bloom.count <= bloom.capacity:
+            return bloom
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM transactions")
+    existing = cursor.fetchone()[0]
+    cursor.close()
+
+    bloom = BloomFilter(capacity=max(BLOOM_CAPACITY, 2 * existing))
+    if existing:
+        print(f"Rebuilding transaction id filter from {existing} loaded rows...")
+        cursor = connection.cursor()
+        cursor.execute("SELECT transaction_id FROM transactions")
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            bloom.add([r[0] for r in rows])
+        cursor.close()
+    return bloom
+
+def _file_fingerprint(path, offset):
+    """Hash the first and last FINGERPRINT_WINDOW bytes of path[:offset].
+
+    Cheap enough to run on every ingest, and catches rewrites of an
+    append-only file without rereading everything already loaded.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(str(offset).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(offset, FINGERPRINT_WINDOW)))
+        f.seek(max(0, offset - FINGERPRINT_WINDOW))
+        digest.update(f.read(min(offset, FINGERPRINT_WINDOW)))
+    return digest.hexdigest()
+
+@instrument()
+def read_new_rows(path, connection):
+    """Read only the part of a CSV not yet ingested.
+
+    A file whose already-loaded region is unchanged is read from the
+    recorded byte offset; a new or rewritten file is read in full (dedup
+    then drops rows already present). Only complete lines are consumed.
+
+    Returns (df, file_state), where file_state is passed to
+    upsert_transactions to advance the offset in the same transaction.
+    """
+    source = os.path.abspath(path)
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SELECT byte_offset, fingerprint FROM ingest_files WHERE source_path = %s", (source,))
+    previous = cursor.fetchone()
+    cursor.close()
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        if previous and previous['byte_offset'] <= size and \
+                _file_fingerprint(path, previous['byte_offset']) == previous['fingerprint']:
+            start = max(start, previous['byte_offset'])
+        f.seek(start)
+        new_bytes = f.read()
+
+    # Leave a trailing partial line for the next run
+    end = new_bytes.rfind(b'\n') + 1
+    new_bytes = new_bytes[:end]
+    offset = start + end
+
+    if new_bytes:
+        df = pd.read_csv(io.BytesIO(header + new_bytes))
+    else:
+        df = pd.read_csv(io.BytesIO(header))
+    file_state = {
+        'source_path': source,
+        'byte_offset': offset,
+        'fingerprint': _file_fingerprint(path, offset),
+        'rows_read': len(df),
+    }
+    return df, file_state
+
+def _record_file_state(cursor, file_state):
+    """Advance a source file's offset in ingest_files (committed by the caller)."""
+    cursor.execute(
+        """INSERT INTO ingest_files (source_path, byte_offset, fingerprint, rows_read)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE byte_offset = VALUES(byte_offset),
+            fingerprint = VALUES(fingerprint), rows_read = rows_read + VALUES(rows_read),
+            loaded_at = CURRENT_TIMESTAMP""",
+        (file_state['source_path'], file_state['byte_offset'],
+         file_state['fingerprint'], file_state['rows_read'])
+    )
+
+def record_full_load(path, connection, rows_read):
+    """Mark a file loaded in full, so the next incremental run starts at its end.
+
+    The offset stops after the last newline, as read_new_rows would. A final
+    line without one is reread next time and found unchanged by its hash.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - FINGERPRINT_WINDOW))
+        tail = f.read()
+    offset = size - len(tail) + tail.rfind(b'\n') + 1
+    file_state = {
+        'source_path': os.path.abspath(path),
+        'byte_offset': offset,
+        'fingerprint': _file_fingerprint(path, offset),
+        'rows_read': rows_read,
+    }
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM ingest_files WHERE source_path = %s", (file_state['source_path'],))
+        _record_file_state(cursor, file_state)
+        connection.commit()
+    finally:
+        cursor.close()
+
+def _text(values):
+    """Values as Python strings, with missing values kept as None."""
+    return values.astype(str).astype(object).where(values.notna(), None)
+
+def row_hashes(df):
+    """Content hash per transaction row, used to detect changed rows.
+
+    Columns are first cast to fixed types matching what MySQL stores
+    (amounts to cents, age to a whole number), so the same row hashes the
+    same whatever dtypes the rest of its batch gave the frame.
+    """
+    normalized = pd.DataFrame({
+        'transaction_id': _text(df['transaction_id']),
+        'customer_id': _text(df['customer_id']),
+        'transaction_date': pd.to_datetime(df['transaction_date']).astype('datetime64[ns]'),
+        'product_id': _text(df['product_id']),
+        'product_category': _text(df['product_category']),
+        'quantity': df['quantity'].astype(float),
+        'unit_price': df['unit_price'].astype(float).round(2),
+        'total_amount': df['total_amount'].astype(float).round(2),
+        'country': _text(df['country']),
+        'payment_method': _text(df['payment_method']),
+        'customer_age': df['customer_age'].astype(float).round(),
+    }, columns=TRANSACTION_COLUMNS)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+def _existing_rows(connection, transaction_ids):
+    """Fetch stored hash, customer and date for ids that may already be loaded."""
+    frames = []
+    for start in range(0, len(transaction_ids), LOOKUP_BATCH_SIZE):
+        batch = transaction_ids[start:start + LOOKUP_BATCH_SIZE]
+        query = f"""
+        SELECT transaction_id, CAST(row_hash AS CHAR) as row_hash,
+               customer_id as old_customer_id, transaction_date as old_transaction_date
+        FROM transactions
+        WHERE transaction_id IN ({', '.join(['%s'] * len(batch))})
+        """
+        frames.append(read_sql(query, connection, params=tuple(batch)))
+    if not frames:
+        return pd.DataFrame(columns=['transaction_id', 'row_hash', 'old_customer_id', 'old_transaction_date'])
+    return pd.concat(frames, ignore_index=True)
+
+def _to_db_rows(df, columns):
+    """Convert a frame to a list of tuples with NaN as None for executemany."""
+    values = df[columns].astype(object)
+    return list(values.where(pd.notna(values), None).itertuples(index=False, name=None))
+
+@instrument()
+def upsert_transactions(df, connection, file_state=None):
+    """Insert new and update changed transactions, and log every change.
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Rows in the transactions table schema (see data_preprocessing.map_to_schema).
+    connection : MySQL connection
+    file_state : dict, optional
+        Source offset from read_new_rows, recorded in ingest_files when the
+        rows commit.
+
+    Returns a DataFrame of the change log rows written for this batch.
+    """
+    df = df.drop_duplicates('transaction_id', keep='last').copy()
+    df['transaction_id'] = df['transaction_id'].astype(str)
+    df['customer_id'] = df['customer_id'].astype(str)
+    df['product_id'] = df['product_id'].astype(str)
+    df['row_hash'] = row_hashes(df)
+
+    # Only ids the filter has seen need a key lookup; the rest are new
+    bloom = load_key_filter(connection)
+    maybe_existing = bloom.might_contain(df['transaction_id']) if len(df) else np.array([], dtype=bool)
+    existing = _existing_rows(connection, df.loc[maybe_existing, 'transaction_id'].tolist())
+
+    merged = df.merge(existing, on='transaction_id', how='left', suffixes=('', '_stored'), indicator=True)
+    is_new = merged['_merge'] == 'left_only'
+    # Rows loaded before row_hash existed have no stored hash and count as changed once
+    is_changed = ~is_new & (merged['row_hash'].astype(str) != merged['row_hash_stored'])
+    changes = merged[is_new | is_changed].copy()
+    changes['change_type'] = np.where(is_new[is_new | is_changed], 'insert', 'update')
+
+    batch_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    columns = TRANSACTION_COLUMNS + ['row_hash']
+    upsert_sql = f"""INSERT INTO transactions ({', '.join(columns)})
+            VALUES ({', '.join(['%s'] * len(columns))})
+            ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in columns[1:])}"""
+    change_sql = """INSERT INTO transaction_changes
+            (batch_id, transaction_id, change_type, customer_id, transaction_date,
+             old_customer_id, old_transaction_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+
+    changes['batch_id'] = batch_id
+    change_columns = ['batch_id', 'transaction_id', 'change_type', 'customer_id', 'transaction_date',
+                      'old_customer_id', 'old_transaction_date']
+
+    cursor = connection.cursor()
+    try:
+        rows = _to_db_rows(changes, columns)
+        log_rows = _to_db_rows(changes, change_columns)
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            cursor.executemany(upsert_sql, rows[start:start + WRITE_BATCH_SIZE])
+            cursor.executemany(change_sql, log_rows[start:start + WRITE_BATCH_SIZE])
+
+        if file_state is not None:
+            _record_file_state(cursor, file_state)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    # Only remember keys once they are committed
+    new_ids = changes.loc[changes['change_type'] == 'insert', 'transaction_id']
+    if len(new_ids):
+        bloom.add(new_ids)
+    bloom.save(_bloom_path())
+
+    print(f"Inserted {int((changes['change_type'] == 'insert').sum())} and updated "
+          f"{int((changes['change_type'] == 'update').sum())} transactions "
+          f"({len(df) - len(changes)} unchanged)")
+    return changes[change_columns]
+
+def reset_ingest_state():
+    """Forget the key filter after a full drop-and-reload."""
+    path = _bloom_path()
+    if os.path.exists(path):
+        os.remove(path)
+
+def read_changes(connection, after_change_id=0):
+    """Read the change log after a consumer's last processed change_id."""
+    query = """
+    SELECT change_id, batch_id, transaction_id, change_type, customer_id, transaction_date,
+           old_customer_id, old_transaction_date
+    FROM transaction_changes
+    WHERE change_id > %s
+    ORDER BY change_id
+    """
+    return read_sql(query, connection, params=(after_change_id,))
+
+def latest_change_id(connection):
+    """Highest change_id logged so far; a consumer's starting cursor after a full run."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM transaction_changes")
+    change_id = int(cursor.fetchone()[0])
+    cursor.close()
+    return change_id
+
+def affected_customers(changes):
+    """Customers whose aggregates a batch of changes can alter, old and new."""
+    ids = pd.concat([changes['customer_id'], changes['old_customer_id']]).dropna()
+    return ids.astype(str).unique().tolist()
+
+def affected_days(changes):
+    """Calendar days whose daily totals a batch of changes can alter, old and new."""
+    dates = pd.concat([changes['transaction_date'], changes['old_transaction_date']]).dropna()
+    return sorted(pd.to_datetime(dates).dt.normalize().unique())
@@ -0,0 +1,198 @@
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from dotenv import load_dotenv
+
+from duckdb_engine import is_duckdb_connection
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters (read once at import, so disabled stages cost nothing)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0').lower() in ('1', 'true', 'yes')
+METRICS_LOG = os.getenv('METRICS_LOG', os.path.join('logs', 'metrics.jsonl'))
+METRICS_TO_DATABASE = os.getenv('METRICS_TO_DATABASE', '0').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.getenv('PROFILE_DIR')  # cProfile dumps per stage when set
+
+RUN_ID = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+
+# Stage records collected during this run, flushed by save_metrics_to_database
+_records = []
+
+# Only one cProfile profiler can be active, so nested stages share the outer dump
+_profiling = False
+
+# Stages currently open; only the outermost one resets the peak RSS
+_depth = 0
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB.
+
+    On Linux this is the kernel's high-water mark, which reset_peak_rss()
+    can lower; elsewhere it is the peak since the process started.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS; returns False where the OS does not allow it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _count_rows(value):
+    """Best-effort row count for DataFrames, arrays and tuples of them."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, (list, dict)):
+        return len(value)
+    return None
+
+def _write_record(record):
+    """Append one stage record to the JSON lines log."""
+    _records.append(record)
+    directory = os.path.dirname(METRICS_LOG)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(METRICS_LOG, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+@contextmanager
+def _measure(stage_name, rows_in=None):
+    """Measure one stage and write its record; yields a dict for rows_out.
+
+    An outermost stage resets the peak RSS first, so its peak is its own. A
+    nested stage cannot reset it without hiding the outer stage's peak, so
+    its peak may come from earlier in the enclosing stage and is recorded
+    with peak_rss_inherited set.
+    """
+    global _profiling, _depth
+    outcome = {'rows_out': None}
+    profiler = cProfile.Profile() if PROFILE_DIR and not _profiling else None
+    inherited = _depth > 0 or not reset_peak_rss()
+    _depth += 1
+    rss_before = peak_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = 'ok'
+    if profiler is not None:
+        _profiling = True
+        profiler.enable()
+    try:
+        yield outcome
+    except Exception as e:
+        status = f"error: {e}"
+        raise
+    finally:
+        _depth -= 1
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            if not os.path.exists(PROFILE_DIR):
+                os.makedirs(PROFILE_DIR)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{RUN_ID}_{stage_name}.prof"))
+        peak_rss = peak_rss_mb()
+        _write_record({
+            'run_id': RUN_ID,
+            'stage': stage_name,
+            'wall_seconds': round(time.perf_counter() - wall_start, 4),
+            'cpu_seconds': round(time.process_time() - cpu_start, 4),
+            'rows_in': rows_in,
+            'rows_out': outcome['rows_out'],
+            'peak_rss_mb': round(peak_rss, 2),
+            'rss_growth_mb': round(peak_rss - rss_before, 2),
+            'peak_rss_inherited': inherited,
+            'status': status,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        })
+
+def instrument(stage_name=None):
+    """Decorator recording wall/CPU time, rows in/out and peak RSS for a function.
+
+    Rows in are counted from the first argument and rows out from the return
+    value. When METRICS_ENABLED is off the function is returned unchanged, so
+    there is no per-call overhead.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        name = stage_name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _measure(name, _count_rows(args[0]) if args else None) as outcome:
+                result = func(*args, **kwargs)
+                outcome['rows_out'] = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+def stage(stage_name, rows_in=None):
+    """Context manager form of instrument() for blocks that are not functions.
+
+    Set `rows_out` on the yielded dict to record output rows. A no-op when
+    METRICS_ENABLED is off.
+    """
+    if not METRICS_ENABLED:
+        return nullcontext({})
+    return _measure(stage_name, rows_in)
+
+def _insert_metrics(connection):
+    cursor = connection.cursor()
+    sql = """INSERT INTO pipeline_metrics
+            (run_id, stage_name, wall_seconds, cpu_seconds, rows_in, rows_out, peak_rss_mb,
+             peak_rss_inherited, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+    cursor.executemany(sql, [
+        (r['run_id'], r['stage'], r['wall_seconds'], r['cpu_seconds'],
+         r['rows_in'], r['rows_out'], r['peak_rss_mb'], r['peak_rss_inherited'], r['status'][:255])
+        for r in _records
+    ])
+    connection.commit()
+    cursor.close()
+
+def save_metrics_to_database(connection):
+    """Write this run's stage records to the pipeline_metrics table.
+
+    Only runs when METRICS_TO_DATABASE is on. pipeline_metrics lives in
+    MySQL, so when `connection` is DuckDB a MySQL connection is opened for
+    the write.
+    """
+    if not (METRICS_ENABLED and METRICS_TO_DATABASE and _records):
+        return
+
+    if is_duckdb_connection(connection):
+        import mysql.connector
+        mysql_connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('DB_NAME', 'ecommerce_analysis')
+        )
+        try:
+            _insert_metrics(mysql_connection)
+        finally:
+            mysql_connection.close()
+    else:
+        _insert_metrics(connection)
+    _records.clear()
@@ -0,0 +1,183 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from importlib import metadata as package_metadata
+from dotenv import load_dotenv
+import joblib
+
+from duckdb_engine import is_duckdb_connection
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters
+MODEL_REGISTRY_ENABLED = os.getenv('MODEL_REGISTRY_ENABLED', '1').lower() in ('1', 'true', 'yes')
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', 'models')
+MODEL_REGISTRY_KEEP = int(os.getenv('MODEL_REGISTRY_KEEP', '5'))  # Versions kept per model name
+
+# Packages whose versions must match for a pickled model to be reused
+MODEL_LIBRARIES = ['scikit-learn', 'statsmodels', 'numpy', 'pandas', 'joblib']
+
+# Models registered during this run, flushed by save_models_to_database
+_pending = []
+
+def fingerprint_data(*parts):
+    """Return a stable hex digest of the training data and parameters.
+
+    DataFrames and Series are hashed column-wise with pandas' vectorized row
+    hashing, NumPy arrays by their raw bytes, and anything else by repr().
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(repr(list(part.columns) if isinstance(part, pd.DataFrame) else part.name).encode())
+            digest.update(repr([str(t) for t in np.atleast_1d(part.dtypes)]).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            digest.update(repr((part.shape, str(part.dtype))).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+def library_versions():
+    """Installed versions of MODEL_LIBRARIES, recorded with every registered model."""
+    versions = {}
+    for package in MODEL_LIBRARIES:
+        try:
+            versions[package] = package_metadata.version(package)
+        except package_metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+def _model_dir(model_name):
+    return os.path.join(MODEL_REGISTRY_DIR, model_name)
+
+def _prune_versions(model_name, keep=MODEL_REGISTRY_KEEP):
+    """Delete all but the newest `keep` version folders of a model."""
+    directory = _model_dir(model_name)
+    versions = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def register_model(model_name, model_type, model, metrics, fingerprint, feature_schema, accuracy_metric=None):
+    """Save a trained model artifact with its metadata and queue it for predictive_models.
+
+    Parameters:
+    -----------
+    model_name : str
+        Registry name, e.g. 'customer_kmeans'. Versions of one name share a folder.
+    model_type : str
+        Algorithm label stored in predictive_models.model_type.
+    model : object
+        Anything joblib can pickle. It is stored uncompressed so that NumPy
+        arrays inside it can be memory-mapped on load.
+    metrics : dict
+        Evaluation metrics; `accuracy_metric` names the one copied into
+        predictive_models.accuracy_score.
+    fingerprint : str
+        Digest of the training data from fingerprint_data.
+    feature_schema : dict
+        Feature names and parameters a caller must match to reuse the model.
+
+    Returns the version directory, or None when the registry is disabled.
+    Versions beyond the newest MODEL_REGISTRY_KEEP are deleted.
+    """
+    if not MODEL_REGISTRY_ENABLED:
+        return None
+
+    created_at = datetime.now()
+    version_dir = os.path.join(_model_dir(model_name), f"{created_at.strftime('%Y%m%d%H%M%S%f')}_{fingerprint[:12]}")
+    os.makedirs(version_dir)
+
+    joblib.dump(model, os.path.join(version_dir, 'model.joblib'))
+    metadata = {
+        'model_name': model_name,
+        'model_type': model_type,
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'data_fingerprint': fingerprint,
+        'feature_schema': feature_schema,
+        'metrics': {k: float(v) for k, v in metrics.items()},
+        'accuracy_metric': accuracy_metric,
+        'library_versions': library_versions(),
+    }
+    with open(os.path.join(version_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    _pending.append((version_dir, metadata))
+    _prune_versions(model_name)
+    return version_dir
+
+def load_latest_model(model_name, fingerprint, feature_schema):
+    """Load the newest registered model trained on the same data and schema.
+
+    Returns (model, metadata), or None when the registry is disabled or no
+    compatible version exists. Version folders are named by timestamp and
+    fingerprint prefix, so only matching candidates are opened. Versions
+    saved under other library versions are skipped without unpickling, and
+    any error while loading one is reported and the next is tried, so the
+    caller retrains rather than fails.
+    """
+    if not MODEL_REGISTRY_ENABLED:
+        return None
+    directory = _model_dir(model_name)
+    if not os.path.isdir(directory):
+        return None
+
+    candidates = sorted(
+        (name for name in os.listdir(directory) if name.endswith(f"_{fingerprint[:12]}")),
+        reverse=True
+    )
+    current_versions = library_versions()
+    for name in candidates:
+        version_dir = os.path.join(directory, name)
+        try:
+            with open(os.path.join(version_dir, 'metadata.json')) as f:
+                metadata = json.load(f)
+            if metadata['data_fingerprint'] != fingerprint or metadata['feature_schema'] != feature_schema:
+                continue
+            if metadata.get('library_versions') != current_versions:
+                print(f"Skipping model {version_dir}: trained with other library versions")
+                continue
+            model = joblib.load(os.path.join(version_dir, 'model.joblib'), mmap_mode='r')
+        except Exception as e:
+            print(f"Skipping unreadable model {version_dir}: {e}")
+            continue
+        print(f"Reusing {model_name} trained {metadata['created_at']} (data unchanged)")
+        return model, metadata
+    return None
+
+def save_models_to_database(connection):
+    """Record this run's newly registered models in the predictive_models table.
+
+    The table is a history for reporting. Lookups go through the version
+    folders, which stay authoritative even when a full setup_database run
+    drops the table.
+    """
+    if not _pending or is_duckdb_connection(connection):
+        return
+
+    cursor = connection.cursor()
+    sql = """INSERT INTO predictive_models
+            (model_name, model_type, accuracy_score, artifact_path, data_fingerprint, feature_schema, metrics)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+    rows = []
+    for version_dir, metadata in _pending:
+        accuracy = metadata['metrics'].get(metadata['accuracy_metric'])
+        rows.append((
+            metadata['model_name'],
+            metadata['model_type'],
+            round(accuracy, 2) if accuracy is not None and np.isfinite(accuracy) else None,
+            version_dir,
+            metadata['data_fingerprint'],
+            json.dumps(metadata['feature_schema']),
+            json.dumps(metadata['metrics']),
+        ))
+    cursor.executemany(sql, rows)
+    connection.commit()
+    cursor.close()
+    _pending.clear()
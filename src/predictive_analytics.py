@@ -12,6 +12,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from statsmodels.tsa.seasonal import seasonal_decompose
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from duckdb_engine import ANALYTICS_ENGINE, create_duckdb_connection, read_sql, aggregate_frame
+from instrumentation import instrument, stage, save_metrics_to_database
+from model_registry import fingerprint_data, register_model, load_latest_model, save_models_to_database
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +29,7 @@ def create_database_connection():
     )
     return connection
 
+@instrument()
 def get_data(connection):
     """Get transaction data for analysis."""
     query = """
@@ -37,15 +41,25 @@ def get_data(connection):
         country
     FROM transactions
     """
-    return pd.read_sql(query, connection)
+    return read_sql(query, connection)
 
+@instrument()
 def prepare_time_series_data(df):
     """Prepare data for time series analysis."""
     df['transaction_date'] = pd.to_datetime(df['transaction_date'])
-    daily_sales = df.groupby('transaction_date')['total_amount'].sum().reset_index()
+    if ANALYTICS_ENGINE == 'duckdb':
+        daily_sales = aggregate_frame(df, """
+            SELECT transaction_date, SUM(total_amount) AS total_amount
+            FROM df
+            GROUP BY transaction_date
+            ORDER BY transaction_date
+        """)
+    else:
+        daily_sales = df.groupby('transaction_date')['total_amount'].sum().reset_index()
     daily_sales.set_index('transaction_date', inplace=True)
     return daily_sales
 
+@instrument()
 def forecast_sales(daily_sales):
     """Forecast future sales using Holt-Winters method."""
     # Create directory for predictions if it doesn't exist
@@ -75,15 +89,29 @@ def forecast_sales(daily_sales):
         plt.savefig('predictions/sales_decomposition.png')
         plt.close()
     
-    # Fit Holt-Winters model with optimized parameters
-    model = ExponentialSmoothing(
-        daily_sales['total_amount'],
-        seasonal_periods=7,
-        trend='add',
-        seasonal='add',
-        initialization_method='estimated',
-        use_boxcox=True
-    ).fit(optimized=True)
+    # Reuse the fitted model when the daily series has not changed
+    model_schema = {'series': 'total_amount', 'seasonal_periods': 7, 'trend': 'add',
+                    'seasonal': 'add', 'use_boxcox': True}
+    fingerprint = fingerprint_data(daily_sales['total_amount'])
+    cached = load_latest_model('sales_holt_winters', fingerprint, model_schema)
+    if cached is not None:
+        model = cached[0]
+    else:
+        # Fit Holt-Winters model with optimized parameters
+        model = ExponentialSmoothing(
+            daily_sales['total_amount'],
+            seasonal_periods=7,
+            trend='add',
+            seasonal='add',
+            initialization_method='estimated',
+            use_boxcox=True
+        ).fit(optimized=True)
+        
+        observed = daily_sales['total_amount']
+        in_sample_r2 = 1 - model.sse / ((observed - observed.mean()) ** 2).sum()
+        register_model('sales_holt_winters', 'ExponentialSmoothing', model,
+                       {'in_sample_r2': in_sample_r2, 'sse': model.sse, 'aic': model.aic},
+                       fingerprint, model_schema, accuracy_metric='in_sample_r2')
     
     # Make predictions for next 30 days
     forecast_horizon = 30
@@ -110,16 +138,31 @@ def forecast_sales(daily_sales):
     
     return forecast
 
+@instrument()
 def calculate_customer_ltv(df):
     """Calculate and predict customer lifetime value."""
     # Calculate key customer metrics
-    customer_metrics = df.groupby('customer_id').agg({
-        'total_amount': ['count', 'sum', 'mean'],
-        'transaction_date': ['min', 'max']
-    }).reset_index()
-    
-    customer_metrics.columns = ['customer_id', 'frequency', 'monetary', 'avg_order_value', 
-                              'first_purchase', 'last_purchase']
+    if ANALYTICS_ENGINE == 'duckdb':
+        customer_metrics = aggregate_frame(df, """
+            SELECT
+                customer_id,
+                COUNT(total_amount) AS frequency,
+                SUM(total_amount) AS monetary,
+                AVG(total_amount) AS avg_order_value,
+                MIN(transaction_date) AS first_purchase,
+                MAX(transaction_date) AS last_purchase
+            FROM df
+            GROUP BY customer_id
+            ORDER BY customer_id
+        """)
+    else:
+        customer_metrics = df.groupby('customer_id').agg({
+            'total_amount': ['count', 'sum', 'mean'],
+            'transaction_date': ['min', 'max']
+        }).reset_index()
+        
+        customer_metrics.columns = ['customer_id', 'frequency', 'monetary', 'avg_order_value', 
+                                  'first_purchase', 'last_purchase']
     
     # Calculate customer age and purchase frequency
     customer_metrics['customer_age'] = (
@@ -158,14 +201,22 @@ def calculate_customer_ltv(df):
     # Split data and train model
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Train model
-    model = LinearRegression()
-    model.fit(X_train_scaled, y_train)
+    # Reuse the scaler and model when the training data has not changed
+    model_schema = {'features': features, 'target': 'ltv', 'test_size': 0.2}
+    fingerprint = fingerprint_data(X, y)
+    cached = load_latest_model('customer_ltv', fingerprint, model_schema)
+    if cached is not None:
+        model, scaler = cached[0]
+        X_test_scaled = scaler.transform(X_test)
+    else:
+        # Scale features
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+        
+        # Train model
+        model = LinearRegression()
+        model.fit(X_train_scaled, y_train)
     
     # Make predictions
     y_pred = model.predict(X_test_scaled)
@@ -174,47 +225,53 @@ def calculate_customer_ltv(df):
     r2 = r2_score(y_test, y_pred)
     rmse = np.sqrt(mean_squared_error(y_test, y_pred))
     
+    if cached is None:
+        register_model('customer_ltv', 'LinearRegression', (model, scaler),
+                       {'r2': r2, 'rmse': rmse}, fingerprint, model_schema, accuracy_metric='r2')
+    
     print(f"\nModel Performance:")
     print(f"R² Score: {r2:.4f}")
     print(f"RMSE: ${rmse:.2f}")
     
-    # Plot actual vs predicted LTV
-    plt.figure(figsize=(10, 6))
-    plt.scatter(y_test, y_pred, alpha=0.5)
-    plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
-    plt.xlabel('Actual LTV')
-    plt.ylabel('Predicted LTV')
-    plt.title(f'Customer Lifetime Value: Actual vs Predicted (R² = {r2:.4f})')
-    plt.tight_layout()
-    plt.savefig('predictions/ltv_prediction.png')
-    plt.close()
+    with stage('render_ltv_charts'):
+        # Plot actual vs predicted LTV
+        plt.figure(figsize=(10, 6))
+        plt.scatter(y_test, y_pred, alpha=0.5)
+        plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
+        plt.xlabel('Actual LTV')
+        plt.ylabel('Predicted LTV')
+        plt.title(f'Customer Lifetime Value: Actual vs Predicted (R² = {r2:.4f})')
+        plt.tight_layout()
+        plt.savefig('predictions/ltv_prediction.png')
+        plt.close()
     
-    # Plot feature importance
-    plt.figure(figsize=(10, 6))
-    feature_importance = pd.DataFrame({
-        'feature': features,
-        'importance': abs(model.coef_)
-    })
-    feature_importance = feature_importance.sort_values('importance', ascending=True)
-    
-    plt.barh(feature_importance['feature'], feature_importance['importance'])
-    plt.title('Feature Importance for LTV Prediction')
-    plt.xlabel('Importance')
-    plt.tight_layout()
-    plt.savefig('predictions/ltv_feature_importance.png')
-    plt.close()
+        # Plot feature importance
+        plt.figure(figsize=(10, 6))
+        feature_importance = pd.DataFrame({
+            'feature': features,
+            'importance': abs(model.coef_)
+        })
+        feature_importance = feature_importance.sort_values('importance', ascending=True)
+    
+        plt.barh(feature_importance['feature'], feature_importance['importance'])
+        plt.title('Feature Importance for LTV Prediction')
+        plt.xlabel('Importance')
+        plt.tight_layout()
+        plt.savefig('predictions/ltv_feature_importance.png')
+        plt.close()
     
     return model, scaler, feature_importance
 
 def main():
     try:
-        # Create database connection
+        # Create database connection; models and metrics are always recorded in MySQL
         print("Connecting to database...")
         connection = create_database_connection()
+        analytics_connection = create_duckdb_connection() if ANALYTICS_ENGINE == 'duckdb' else connection
         
         # Get data
         print("Getting transaction data...")
-        df = get_data(connection)
+        df = get_data(analytics_connection)
         
         # Prepare time series data
         print("Preparing time series data...")
@@ -233,10 +290,14 @@ def main():
         # Save the results
         sales_forecast.to_csv('predictions/sales_forecast.csv')
         feature_importance.to_csv('predictions/ltv_feature_importance.csv')
+        save_models_to_database(connection)
+        save_metrics_to_database(connection)
         
     except Exception as e:
         print(f"Error during analysis: {e}")
     finally:
+        if 'analytics_connection' in locals() and analytics_connection is not connection:
+            analytics_connection.close()
         if 'connection' in locals():
             connection.close()
 
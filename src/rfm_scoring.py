@@ -0,0 +1,287 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+from dotenv import load_dotenv
+
+from duckdb_engine import ANALYTICS_ENGINE, create_duckdb_connection, read_sql
+from instrumentation import instrument, save_metrics_to_database
+from model_registry import MODEL_REGISTRY_DIR
+from incremental_ingest import read_changes, affected_customers, latest_change_id
+
+# Load environment variables
+load_dotenv()
+
+# Configuration parameters
+RFM_AS_OF_DATE = os.getenv('RFM_AS_OF_DATE')  # Defaults to the day after the latest purchase
+RFM_STATE_PATH = os.getenv('RFM_STATE_PATH', os.path.join(MODEL_REGISTRY_DIR, 'rfm_state.json'))
+RFM_APPROX_THRESHOLD = 1_000_000  # Above this many customers, percentiles come from a sample
+RFM_SAMPLE_SIZE = 200_000         # Sample size for approximate percentiles
+RFM_WRITE_BATCH_SIZE = 10_000     # Rows per bulk upsert into customer_segments
+RFM_ID_BATCH_SIZE = 1_000         # Customer ids per IN (...) lookup
+
+PERCENTILES = np.linspace(0, 1, 101)
+
+RFM_QUERY = """
+SELECT
+    customer_id,
+    MAX(transaction_date) as last_purchase_date,
+    COUNT(DISTINCT transaction_id) as frequency,
+    SUM(total_amount) as monetary
+FROM transactions
+{where}
+GROUP BY customer_id
+"""
+
+def resolve_as_of_date(purchase_dates, as_of_date=None):
+    """Pick the reference date recency is measured from.
+
+    An explicit date wins, then RFM_AS_OF_DATE, then the day after the
+    latest purchase, so repeated runs on the same data give the same result.
+    """
+    if as_of_date is None:
+        as_of_date = RFM_AS_OF_DATE
+    if as_of_date is not None:
+        return pd.Timestamp(as_of_date).normalize()
+    return pd.to_datetime(purchase_dates).max().normalize() + pd.Timedelta(days=1)
+
+def percentile_grid(values, approximate=None, seed=42):
+    """Return the 0th to 100th percentiles of values, the cut points _score ranks against.
+
+    For more than RFM_APPROX_THRESHOLD values the percentiles are estimated
+    from a seeded sample of RFM_SAMPLE_SIZE. That avoids sorting the full
+    column, and with 200k samples each one lands within about 0.3
+    percentile points of the exact one.
+    """
+    values = np.asarray(values, dtype=float)
+    if approximate is None:
+        approximate = len(values) > RFM_APPROX_THRESHOLD
+    if approximate and len(values) > RFM_SAMPLE_SIZE:
+        rng = np.random.default_rng(seed)
+        values = values[rng.integers(0, len(values), RFM_SAMPLE_SIZE)]
+    return np.quantile(values, PERCENTILES).tolist()
+
+def _score(values, grid, higher_is_better=True):
+    """Map values to 1-5 by the quintile of their mid-rank in a percentile grid.
+
+    Tied values share the middle of the ranks they span. A value held by
+    many customers, like a frequency of 3, then lands in the band around
+    the middle of its share instead of leaving the bands below it empty.
+    """
+    values = np.asarray(values, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    rank = (np.searchsorted(grid, values, side='left') + np.searchsorted(grid, values, side='right')) / 2
+    scores = np.clip(np.ceil(5 * rank / len(grid)), 1, 5).astype(int)
+    return scores if higher_is_better else 6 - scores
+
+def segment_names(r_scores, f_scores):
+    """Name RFM segments from recency and frequency scores."""
+    conditions = [
+        (r_scores >= 4) & (f_scores >= 4),
+        (r_scores >= 3) & (f_scores >= 3),
+        (r_scores >= 4) & (f_scores <= 2),
+        (r_scores <= 2) & (f_scores >= 3),
+        (r_scores <= 2) & (f_scores <= 2),
+    ]
+    choices = ['Champions', 'Loyal Customers', 'New Customers', 'At Risk', 'Hibernating']
+    return np.select(conditions, choices, default='Need Attention')
+
+@instrument()
+def compute_rfm_scores(df, as_of_date=None, percentiles=None, approximate=None):
+    """Score customers on recency, frequency and monetary quintiles in one pass.
+
+    Parameters:
+    -----------
+    df : DataFrame
+        One row per customer with customer_id, last_purchase_date, frequency
+        and monetary columns, as returned by get_rfm_features.
+    as_of_date : date-like, optional
+        Reference date for recency; see resolve_as_of_date.
+    percentiles : dict, optional
+        Percentile grids from an earlier full scoring ({'recency': [...], ...}).
+        Pass them when re-scoring a subset so scores stay comparable.
+    approximate : bool, optional
+        Force sampled (True) or exact (False) percentiles; by default
+        sampling is used above RFM_APPROX_THRESHOLD customers.
+
+    Returns (scores, state), where scores has r/f/m scores, the combined
+    rfm_score (e.g. 545) and segment_name per customer, and state holds the
+    as-of date and percentile grids needed to re-score customers later.
+    """
+    as_of = resolve_as_of_date(df['last_purchase_date'], as_of_date)
+    recency = (as_of - pd.to_datetime(df['last_purchase_date'])).dt.days.clip(lower=0).to_numpy()
+    frequency = df['frequency'].to_numpy(dtype=float)
+    monetary = df['monetary'].to_numpy(dtype=float)
+
+    if percentiles is None:
+        percentiles = {
+            'recency': percentile_grid(recency, approximate),
+            'frequency': percentile_grid(frequency, approximate),
+            'monetary': percentile_grid(monetary, approximate),
+        }
+
+    r_scores = _score(recency, percentiles['recency'], higher_is_better=False)
+    f_scores = _score(frequency, percentiles['frequency'])
+    m_scores = _score(monetary, percentiles['monetary'])
+
+    scores = pd.DataFrame({
+        'customer_id': df['customer_id'].to_numpy(),
+        'recency_days': recency,
+        'r_score': r_scores,
+        'f_score': f_scores,
+        'm_score': m_scores,
+        'rfm_score': r_scores * 100 + f_scores * 10 + m_scores,
+        'segment_name': segment_names(r_scores, f_scores),
+    })
+    state = {
+        'as_of_date': as_of.strftime('%Y-%m-%d'),
+        'percentiles': percentiles,
+        'n_customers': len(df),
+    }
+    return scores, state
+
+@instrument()
+def get_rfm_features(connection, customer_ids=None):
+    """Aggregate recency, frequency and monetary inputs per customer, optionally only `customer_ids`."""
+    if customer_ids is None:
+        return read_sql(RFM_QUERY.format(where=''), connection)
+
+    customer_ids = list(customer_ids)
+    frames = []
+    for start in range(0, len(customer_ids), RFM_ID_BATCH_SIZE):
+        batch = customer_ids[start:start + RFM_ID_BATCH_SIZE]
+        where = f"WHERE customer_id IN ({', '.join(['%s'] * len(batch))})"
+        frames.append(read_sql(RFM_QUERY.format(where=where), connection, params=tuple(batch)))
+    if not frames:
+        return read_sql(RFM_QUERY.format(where='WHERE 1 = 0'), connection)
+    return pd.concat(frames, ignore_index=True)
+
+@instrument()
+def save_rfm_scores_to_database(scores, connection):
+    """Bulk upsert rfm_score and rfm_segment into customer_segments.
+
+    The RFM segment has its own column so it always matches rfm_score;
+    segment_name is left to clustering.
+    """
+    cursor = connection.cursor()
+    sql = """INSERT INTO customer_segments
+            (customer_id, rfm_score, rfm_segment)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE rfm_score = VALUES(rfm_score), rfm_segment = VALUES(rfm_segment)"""
+    rows = list(zip(
+        scores['customer_id'].astype(str),
+        scores['rfm_score'].astype(int).tolist(),
+        scores['segment_name']
+    ))
+    for start in range(0, len(rows), RFM_WRITE_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + RFM_WRITE_BATCH_SIZE])
+    connection.commit()
+    cursor.close()
+
+def load_rfm_state(path=RFM_STATE_PATH):
+    """Read the as-of date and cut points saved by the last full scoring."""
+    with open(path) as f:
+        return json.load(f)
+
+def save_rfm_state(state, path=RFM_STATE_PATH):
+    """Persist the as-of date and cut points for incremental re-scoring."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+def change_log_was_reset(connection, state):
+    """True when the change log restarted below the change_id saved in state."""
+    return latest_change_id(connection) < state.get('last_change_id', 0)
+
+def rescore_customers(connection, customer_ids=None, state=None):
+    """Re-score only affected customers against saved cut points.
+
+    Customers are taken from `customer_ids`, or by default from the
+    transaction_changes log after the last change_id this stage consumed
+    (state['last_change_id'] is advanced).
+
+    Recency is still measured from the saved as-of date, so these scores
+    line up with the last full run. Run a full scoring periodically to move
+    the as-of date forward and refresh the cut points.
+
+    Raises ValueError when the change log is behind the saved change_id,
+    which happens after a full load recreates it; score everyone instead.
+    """
+    if state is None:
+        state = load_rfm_state()
+    if customer_ids is None:
+        if change_log_was_reset(connection, state):
+            raise ValueError("The change log was reset since the last RFM scoring; run a full scoring")
+        changes = read_changes(connection, state.get('last_change_id', 0))
+        if changes.empty:
+            return pd.DataFrame()
+        customer_ids = affected_customers(changes)
+        state['last_change_id'] = int(changes['change_id'].max())
+
+    df = get_rfm_features(connection, customer_ids=customer_ids)
+    if df.empty:
+        return df
+    scores, _ = compute_rfm_scores(df, as_of_date=state['as_of_date'], percentiles=state['percentiles'])
+    return scores
+
+def main():
+    parser = argparse.ArgumentParser(description="Score customers by recency, frequency and monetary value.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="re-score only customers in the change log since the last run")
+    parser.add_argument('--as-of', help="reference date for recency (default: day after the latest purchase)")
+    args = parser.parse_args()
+
+    try:
+        # Create database connection; scores are always written to MySQL
+        print("Connecting to database...")
+        import mysql.connector
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('DB_NAME', 'ecommerce_analysis')
+        )
+        state = load_rfm_state() if args.incremental else None
+        if state is not None and 'percentiles' not in state:
+            print("The saved RFM state has no percentile grids; scoring all customers instead.")
+            state = None
+        if state is not None and change_log_was_reset(connection, state):
+            print("The change log was reset by a full load; scoring all customers instead.")
+            state = None
+        analytics_connection = create_duckdb_connection() if ANALYTICS_ENGINE == 'duckdb' and state is None else connection
+
+        # Taken before reading so rows loaded mid-run are picked up next time
+        last_change_id = latest_change_id(connection)
+        if state is not None:
+            print("Re-scoring customers with new transactions...")
+            scores = rescore_customers(connection, state=state)
+        else:
+            print("Scoring all customers...")
+            df = get_rfm_features(analytics_connection)
+            scores, state = compute_rfm_scores(df, as_of_date=args.as_of)
+            state['last_change_id'] = last_change_id
+
+        print(f"Saving {len(scores)} RFM scores...")
+        if not scores.empty:
+            save_rfm_scores_to_database(scores, connection)
+            print("\nRFM Segments:")
+            print("-" * 50)
+            print(scores['segment_name'].value_counts().to_string())
+
+        save_rfm_state(state)
+        save_metrics_to_database(connection)
+        print("\nRFM scoring completed successfully!")
+
+    except Exception as e:
+        print(f"Error during RFM scoring: {e}")
+    finally:
+        if 'analytics_connection' in locals() and analytics_connection is not connection:
+            analytics_connection.close()
+        if 'connection' in locals():
+            connection.close()
+
+if __name__ == "__main__":
+    main()
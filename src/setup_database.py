@@ -1,6 +1,7 @@
 import mysql.connector
 from dotenv import load_dotenv
 import os
+from incremental_ingest import INGEST_MODE
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +17,44 @@ def create_database(connection):
     finally:
         cursor.close()
 
-def create_tables(connection):
-    """Create all necessary tables."""
+# Columns and indexes added after the first release, for tables kept by incremental mode
+ADDED_COLUMNS = [
+    ('transactions', 'row_hash', 'BIGINT UNSIGNED'),
+    ('customer_segments', 'rfm_segment', 'VARCHAR(50)'),
+    ('pipeline_metrics', 'peak_rss_inherited', 'BOOLEAN'),
+    ('predictive_models', 'artifact_path', 'VARCHAR(255)'),
+    ('predictive_models', 'data_fingerprint', 'CHAR(64)'),
+    ('predictive_models', 'feature_schema', 'TEXT'),
+    ('predictive_models', 'metrics', 'TEXT'),
+]
+ADDED_INDEXES = [
+    ('predictive_models', 'idx_model_fingerprint', '(model_name, data_fingerprint)'),
+]
+
+def migrate_tables(cursor):
+    """Add columns and indexes missing from tables created by an older schema."""
+    for table, column, definition in ADDED_COLUMNS:
+        cursor.execute("""SELECT COUNT(*) FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+                       (table, column))
+        if cursor.fetchone()[0] == 0:
+            print(f"Adding column {table}.{column}")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    for table, index, columns in ADDED_INDEXES:
+        cursor.execute("""SELECT COUNT(*) FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s""",
+                       (table, index))
+        if cursor.fetchone()[0] == 0:
+            print(f"Adding index {table}.{index}")
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} {columns}")
+
+def create_tables(connection, drop_existing=True):
+    """Create all necessary tables.
+    
+    With drop_existing=False, existing tables and their data are kept, as
+    incremental ingest needs, and brought up to the current schema.
+    """
     cursor = connection.cursor()
     
     # First, create the transactions table with all necessary indexes
@@ -34,6 +71,7 @@ def create_tables(connection):
         country VARCHAR(100),
         payment_method VARCHAR(50),
         customer_age INT,
+        row_hash BIGINT UNSIGNED,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         INDEX idx_customer_id (customer_id),
         INDEX idx_transaction_date (transaction_date),
@@ -48,6 +86,7 @@ def create_tables(connection):
         customer_id VARCHAR(50),
         segment_name VARCHAR(50),
         rfm_score INT,
+        rfm_segment VARCHAR(50),
         cluster_id INT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         PRIMARY KEY (customer_id),
@@ -77,22 +116,82 @@ def create_tables(connection):
         model_name VARCHAR(100),
         model_type VARCHAR(50),
         accuracy_score DECIMAL(5,2),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        artifact_path VARCHAR(255),
+        data_fingerprint CHAR(64),
+        feature_schema TEXT,
+        metrics TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_model_fingerprint (model_name, data_fingerprint)
+    )
+    """
+    
+    # Create pipeline_metrics table for per-stage timings (see instrumentation.py)
+    pipeline_metrics_table = """
+    CREATE TABLE IF NOT EXISTS pipeline_metrics (
+        metric_id INT AUTO_INCREMENT PRIMARY KEY,
+        run_id VARCHAR(50),
+        stage_name VARCHAR(100),
+        wall_seconds DECIMAL(12,4),
+        cpu_seconds DECIMAL(12,4),
+        rows_in BIGINT,
+        rows_out BIGINT,
+        peak_rss_mb DECIMAL(12,2),
+        peak_rss_inherited BOOLEAN,
+        status VARCHAR(255),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_stage_name (stage_name)
+    )
+    """
+    
+    # Source files and byte offsets already ingested
+    ingest_files_table = """
+    CREATE TABLE IF NOT EXISTS ingest_files (
+        source_path VARCHAR(255) PRIMARY KEY,
+        byte_offset BIGINT,
+        fingerprint CHAR(64),
+        rows_read BIGINT,
+        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    
+    # Change log of inserted and updated transactions for downstream stages
+    transaction_changes_table = """
+    CREATE TABLE IF NOT EXISTS transaction_changes (
+        change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        batch_id VARCHAR(50),
+        transaction_id VARCHAR(50),
+        change_type VARCHAR(10),
+        customer_id VARCHAR(50),
+        transaction_date DATETIME,
+        old_customer_id VARCHAR(50),
+        old_transaction_date DATETIME,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_batch_id (batch_id)
     )
     """
     
     try:
-        # Drop existing tables in reverse order to handle foreign key constraints
-        cursor.execute("DROP TABLE IF EXISTS customer_segments")
-        cursor.execute("DROP TABLE IF EXISTS product_recommendations")
-        cursor.execute("DROP TABLE IF EXISTS predictive_models")
-        cursor.execute("DROP TABLE IF EXISTS transactions")
+        if drop_existing:
+            # Drop existing tables in reverse order to handle foreign key constraints
+            cursor.execute("DROP TABLE IF EXISTS customer_segments")
+            cursor.execute("DROP TABLE IF EXISTS product_recommendations")
+            cursor.execute("DROP TABLE IF EXISTS predictive_models")
+            cursor.execute("DROP TABLE IF EXISTS pipeline_metrics")
+            cursor.execute("DROP TABLE IF EXISTS transaction_changes")
+            cursor.execute("DROP TABLE IF EXISTS ingest_files")
+            cursor.execute("DROP TABLE IF EXISTS transactions")
         
         # Create tables in correct order
         cursor.execute(transactions_table)
         cursor.execute(customer_segments_table)
         cursor.execute(product_recommendations_table)
         cursor.execute(predictive_models_table)
+        cursor.execute(pipeline_metrics_table)
+        cursor.execute(ingest_files_table)
+        cursor.execute(transaction_changes_table)
+        
+        if not drop_existing:
+            migrate_tables(cursor)
         
         connection.commit()
         print("Tables and indexes created successfully")
@@ -127,7 +226,7 @@ def main():
         )
         
         # Create tables
-        create_tables(connection)
+        create_tables(connection, drop_existing=INGEST_MODE != 'incremental')
         
         print("\nDatabase setup completed successfully!")
         
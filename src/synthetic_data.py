@@ -0,0 +1,171 @@
+import pandas as pd
+import numpy as np
+import argparse
+import time
+import os
+
+# Configuration parameters
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_SIZE = 1_000_000     # Rows generated and written per chunk
+DEFAULT_START_DATE = '2023-01-01'
+DEFAULT_DAYS = 730                 # Two years, so yearly seasonality is visible
+PURCHASES_PER_CUSTOMER = 5         # Average transactions per customer
+
+# Skewed category mix with a per-category log-normal price level
+CATEGORIES = {
+    # name: (share of transactions, median purchase amount)
+    'Electronics': (0.24, 420.0),
+    'Clothing': (0.20, 85.0),
+    'Home & Kitchen': (0.15, 140.0),
+    'Beauty': (0.12, 45.0),
+    'Books': (0.10, 25.0),
+    'Sports': (0.08, 110.0),
+    'Toys': (0.06, 60.0),
+    'Grocery': (0.05, 35.0),
+}
+
+COUNTRIES = {
+    'USA': 0.30, 'UK': 0.12, 'India': 0.12, 'Germany': 0.09, 'Canada': 0.08,
+    'France': 0.07, 'Australia': 0.06, 'Japan': 0.06, 'Brazil': 0.05, 'Mexico': 0.05,
+}
+
+PAYMENT_METHODS = {
+    'Credit Card': 0.38, 'Debit Card': 0.22, 'PayPal': 0.18,
+    'UPI': 0.10, 'Net Banking': 0.07, 'Cash on Delivery': 0.05,
+}
+
+COLUMNS = ['Transaction_ID', 'User_Name', 'Age', 'Country', 'Product_Category',
+           'Purchase_Amount', 'Payment_Method', 'Transaction_Date']
+
+def _day_weights(n_days, start_date):
+    """Relative sales volume per day: yearly cycle, weekend lift and a holiday peak."""
+    dates = pd.date_range(start_date, periods=n_days, freq='D')
+    day_of_year = dates.dayofyear.to_numpy()
+    weights = 1.0 + 0.25 * np.sin(2 * np.pi * (day_of_year - 80) / 365.25)
+    weights *= np.where(dates.dayofweek.to_numpy() >= 5, 1.3, 1.0)
+    weights *= np.where((dates.month.to_numpy() == 11) & (dates.day.to_numpy() >= 20), 1.8, 1.0)
+    weights *= np.where(dates.month.to_numpy() == 12, 1.4, 1.0)
+    return dates, weights / weights.sum()
+
+def _sample(rng, cdf, size):
+    """Draw indices from a cumulative distribution without re-normalizing each call."""
+    return np.searchsorted(cdf, rng.random(size), side='right').clip(max=len(cdf) - 1)
+
+class _Customers:
+    """Per-customer attributes, fixed for the whole run so repeat purchases agree."""
+
+    def __init__(self, rng, n_customers):
+        self.ages = np.clip(rng.normal(38, 12, n_customers), 18, 75).astype(np.int64)
+        self.countries = _sample(rng, np.cumsum(list(COUNTRIES.values())), n_customers)
+        self.payments = _sample(rng, np.cumsum(list(PAYMENT_METHODS.values())), n_customers)
+        # Heavy-tailed activity: a small share of customers makes most purchases
+        activity = rng.lognormal(0.0, 1.2, n_customers)
+        self.cdf = np.cumsum(activity / activity.sum())
+
+def generate_chunks(n_rows, seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE,
+                    start_date=DEFAULT_START_DATE, n_days=DEFAULT_DAYS, missing_rate=0.0):
+    """Yield synthetic transactions as DataFrames in the ecommerce_transactions.csv schema.
+
+    Parameters:
+    -----------
+    n_rows : int
+        Total number of transactions to generate.
+    seed : int, default=42
+        Seed for the random generator; the same seed always yields the same data.
+    chunk_size : int, default=1_000_000
+        Rows per yielded DataFrame, which bounds memory use.
+    missing_rate : float, default=0.0
+        Fraction of Age, Country and Payment_Method values blanked out, to
+        exercise the missing-value handling in clean_data.
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = max(1, n_rows // PURCHASES_PER_CUSTOMER)
+    customers = _Customers(rng, n_customers)
+    dates, day_probabilities = _day_weights(n_days, start_date)
+    day_cdf = np.cumsum(day_probabilities)
+    date_strings = np.asarray(dates.strftime('%Y-%m-%d'), dtype=object)
+
+    category_names = np.array(list(CATEGORIES), dtype=object)
+    category_cdf = np.cumsum([share for share, _ in CATEGORIES.values()])
+    category_log_medians = np.log([median for _, median in CATEGORIES.values()])
+    country_names = np.array(list(COUNTRIES), dtype=object)
+    payment_names = np.array(list(PAYMENT_METHODS), dtype=object)
+    payment_cdf = np.cumsum(list(PAYMENT_METHODS.values()))
+
+    for offset in range(0, n_rows, chunk_size):
+        size = min(chunk_size, n_rows - offset)
+        customer_idx = _sample(rng, customers.cdf, size)
+        categories = _sample(rng, category_cdf, size)
+        amounts = np.exp(rng.normal(category_log_medians[categories], 0.6)).round(2)
+
+        # Most customers stick to their usual payment method
+        payments = np.where(rng.random(size) < 0.8,
+                            customers.payments[customer_idx],
+                            _sample(rng, payment_cdf, size))
+
+        chunk = pd.DataFrame({
+            'Transaction_ID': np.arange(offset + 1, offset + size + 1),
+            'User_Name': 'User_' + pd.Series(customer_idx).astype(str),
+            'Age': customers.ages[customer_idx].astype(float),
+            'Country': country_names[customers.countries[customer_idx]],
+            'Product_Category': category_names[categories],
+            'Purchase_Amount': amounts,
+            'Payment_Method': payment_names[payments],
+            'Transaction_Date': date_strings[_sample(rng, day_cdf, size)],
+        }, columns=COLUMNS)
+
+        if missing_rate > 0:
+            for column in ('Age', 'Country', 'Payment_Method'):
+                chunk.loc[rng.random(size) < missing_rate, column] = np.nan
+
+        yield chunk
+
+def write_synthetic_data(path, n_rows, seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """Generate n_rows synthetic transactions and write them chunk by chunk.
+
+    Writes CSV by default, or Parquet when the path ends in `.parquet`.
+    Returns the number of rows written.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    # Arrow writers encode each chunk in C++, which is far faster than DataFrame.to_csv
+    is_parquet = path.lower().endswith('.parquet')
+    writer = None
+    written = 0
+    try:
+        for chunk in generate_chunks(n_rows, seed=seed, chunk_size=chunk_size, **kwargs):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema) if is_parquet else pa_csv.CSVWriter(path, table.schema)
+            writer.write_table(table)
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic e-commerce transactions.")
+    parser.add_argument('rows', type=int, help="number of transactions to generate")
+    parser.add_argument('--output', default=os.path.join('data', 'synthetic_transactions.csv'),
+                        help="output .csv or .parquet path")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--missing-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} transactions to {args.output}...")
+    start = time.perf_counter()
+    written = write_synthetic_data(args.output, args.rows, seed=args.seed,
+                                   chunk_size=args.chunk_size, missing_rate=args.missing_rate)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {written:,} rows in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
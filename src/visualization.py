@@ -6,6 +6,9 @@ from datetime import datetime, timedelta
 import mysql.connector
 from dotenv import load_dotenv
 import os
+from duckdb_engine import ANALYTICS_ENGINE, create_duckdb_connection, read_sql
+from instrumentation import instrument, save_metrics_to_database
+from approximate_reports import APPROXIMATE_REPORTS, behavior_aggregates, load_sketches
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +23,7 @@ def create_database_connection():
     )
     return connection
 
+@instrument()
 def get_transaction_data(connection):
     """Get transaction data for analysis."""
     query = """
@@ -32,17 +36,26 @@ def get_transaction_data(connection):
         payment_method
     FROM transactions
     """
-    return pd.read_sql(query, connection)
+    return read_sql(query, connection)
+
+@instrument()
+def analyze_customer_behavior(df=None, aggregates=None):
+    """Analyze and visualize customer behavior.
+
+    Charts are drawn from `aggregates` (see approximate_reports.behavior_aggregates)
+    when given, so they can come from sketches instead of raw transactions.
+    """
+    if aggregates is None:
+        aggregates = behavior_aggregates(df)
 
-def analyze_customer_behavior(df):
-    """Analyze and visualize customer behavior."""
     # Create visualizations directory if it doesn't exist
     if not os.path.exists('visualizations'):
         os.makedirs('visualizations')
     
     # 1. Purchase Amount Distribution
+    amounts, amount_weights = aggregates['amounts']
     plt.figure(figsize=(10, 6))
-    sns.histplot(data=df, x='total_amount', bins=50)
+    sns.histplot(x=amounts, weights=amount_weights, bins=50)
     plt.title('Distribution of Purchase Amounts')
     plt.xlabel('Purchase Amount')
     plt.ylabel('Count')
@@ -51,7 +64,7 @@ def analyze_customer_behavior(df):
     
     # 2. Payment Method Distribution
     plt.figure(figsize=(10, 6))
-    payment_counts = df['payment_method'].value_counts()
+    payment_counts = aggregates['payment_counts']
     plt.pie(payment_counts, labels=payment_counts.index, autopct='%1.1f%%')
     plt.title('Distribution of Payment Methods')
     plt.savefig('visualizations/payment_methods.png')
@@ -59,7 +72,7 @@ def analyze_customer_behavior(df):
     
     # 3. Product Category Analysis
     plt.figure(figsize=(12, 6))
-    category_counts = df['product_category'].value_counts()
+    category_counts = aggregates['category_counts']
     sns.barplot(x=category_counts.values, y=category_counts.index)
     plt.title('Product Category Distribution')
     plt.xlabel('Number of Transactions')
@@ -67,9 +80,9 @@ def analyze_customer_behavior(df):
     plt.close()
     
     # 4. Customer Purchase Frequency
-    customer_frequency = df.groupby('customer_id').size()
+    customer_frequency, frequency_weights = aggregates['purchase_frequency']
     plt.figure(figsize=(10, 6))
-    sns.histplot(customer_frequency, bins=30)
+    sns.histplot(x=customer_frequency, weights=frequency_weights, bins=30)
     plt.title('Customer Purchase Frequency')
     plt.xlabel('Number of Purchases')
     plt.ylabel('Number of Customers')
@@ -78,7 +91,7 @@ def analyze_customer_behavior(df):
     
     # 5. Geographic Distribution
     plt.figure(figsize=(12, 6))
-    country_counts = df['country'].value_counts()
+    country_counts = aggregates['country_counts']
     sns.barplot(x=country_counts.values, y=country_counts.index)
     plt.title('Geographic Distribution of Sales')
     plt.xlabel('Number of Transactions')
@@ -86,8 +99,7 @@ def analyze_customer_behavior(df):
     plt.close()
     
     # 6. Time Series Analysis
-    df['transaction_date'] = pd.to_datetime(df['transaction_date'])
-    daily_sales = df.groupby('transaction_date')['total_amount'].sum().reset_index()
+    daily_sales = aggregates['daily_sales']
     plt.figure(figsize=(15, 6))
     plt.plot(daily_sales['transaction_date'], daily_sales['total_amount'])
     plt.title('Daily Sales Over Time')
@@ -102,15 +114,22 @@ def main():
     try:
         # Create database connection
         print("Connecting to database...")
-        connection = create_database_connection()
-        
-        # Get transaction data
-        print("Getting transaction data...")
-        df = get_transaction_data(connection)
+        connection = create_duckdb_connection() if ANALYTICS_ENGINE == 'duckdb' else create_database_connection()
         
-        # Perform analysis
-        print("Creating visualizations...")
-        analyze_customer_behavior(df)
+        # Use the per-day sketches when approximate mode is on and they exist
+        sketch = load_sketches() if APPROXIMATE_REPORTS else None
+        if sketch is not None:
+            print("Creating visualizations from sketches (approximate)...")
+            analyze_customer_behavior(aggregates=behavior_aggregates(sketch=sketch))
+        else:
+            # Get transaction data
+            print("Getting transaction data...")
+            df = get_transaction_data(connection)
+            
+            # Perform analysis
+            print("Creating visualizations...")
+            analyze_customer_behavior(df)
+        save_metrics_to_database(connection)
         
         print("Analysis completed successfully! Check the 'visualizations' folder for results.")
         